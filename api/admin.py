@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import MatchSummary
+
+
+@admin.register(MatchSummary)
+class MatchSummaryAdmin(admin.ModelAdmin):
+    list_display = ('match_id', 'label', 'teams', 'created_at')
+    search_fields = ('match_id', 'label')
+    readonly_fields = ('created_at', 'updated_at')
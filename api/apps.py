@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .utils import ENGINES
+
+        # Fail at startup rather than on the first analysis
+        if settings.ANALYSIS_ENGINE not in ENGINES:
+            raise ImproperlyConfigured(
+                f"ANALYSIS_ENGINE must be one of {list(ENGINES)}, not {settings.ANALYSIS_ENGINE!r}"
+            )
@@ -0,0 +1,256 @@
+"""
+Per-match summaries and side-by-side comparison of several matches.
+
+A summary holds the counts behind the comparison metrics (W/E by set,
+finishing breakdowns, full shot-sequence counts, rally-length outcomes). It
+is built once from the analysis result and persisted as a MatchSummary, so
+comparing any number of matches only reads small JSON documents.
+"""
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+SUMMARY_VERSION = 1
+SETS = ('set1', 'set2', 'set3')
+RALLY_LENGTHS = ('short', 'medium', 'long')
+DEFAULT_TOP_SEQUENCES = 10
+
+
+class ComparisonError(ValueError):
+    """Raised when the requested comparison cannot be built from the summaries."""
+
+
+def match_summary_id(file_data: str, set_scores: Dict[str, Any]) -> str:
+    """Identify a match by its CSV and set scores."""
+    digest = hashlib.sha256()
+    digest.update(file_data.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(set_scores, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _we_ratio(winners: int, errors: int) -> float:
+    # Same convention as the match statistics: no errors means the winner count
+    return winners / errors if errors > 0 else winners
+
+
+def _rate(part: int, total: int) -> Optional[float]:
+    return part / total * 100 if total > 0 else None
+
+
+def build_match_summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a full analysis result to the counts the comparison needs."""
+    teams = list(result['teams'])
+    by_lower = {team.lower(): team for team in teams}
+    statistics = result['statistics']
+
+    we_by_set = {
+        team: {set_key: dict(statistics['setWeAnalysis'][set_key][team.lower()]) for set_key in SETS}
+        for team in teams
+    }
+
+    rally_length = {
+        team: {
+            category: {
+                'won': statistics['rallyLengthByOutcome'][category][team.lower()],
+                'total': statistics['rallyLengthByOutcome'][category]['total'],
+            }
+            for category in RALLY_LENGTHS
+        }
+        for team in teams
+    }
+
+    finishing = {
+        player['name']: {
+            'team': player['team'],
+            'winners': player['winners'],
+            'errors': player['errors'],
+            'totalFinishes': player['totalFinishes'],
+            'shots': player['shotBreakdown'],
+        }
+        for player in statistics['finishingPlayers']
+    }
+
+    # Full counts rather than the top five kept in the statistics, so any
+    # sequence can be aligned across matches
+    sequences = {team: {'winning': {}, 'losing': {}} for team in teams}
+    for rally in result['rallies']:
+        if not rally['outcome'] or not rally['shots']:
+            continue
+        game_shots = [shot['type'] for shot in rally['shots'] if shot['type'] != 'RECEIVE SERVES']
+        sequence = ' → '.join(game_shots)
+        if not game_shots or sequence == 'SERVE':
+            continue
+        team = by_lower.get(rally['outcome']['outcomeTeam'].lower())
+        kind = {'winner': 'winning', 'error': 'losing'}.get(rally['outcome']['type'].lower())
+        if team and kind:
+            counts = sequences[team][kind]
+            counts[sequence] = counts.get(sequence, 0) + 1
+
+    return {
+        'version': SUMMARY_VERSION,
+        'teams': teams,
+        'players': result['players'],
+        'totalRallies': statistics['totalRallies'],
+        'points': {team: statistics[f'{team}Points'] for team in teams},
+        'weBySet': we_by_set,
+        'finishing': finishing,
+        'sequences': sequences,
+        'rallyLength': rally_length,
+    }
+
+
+def _resolve_side(summary: Dict[str, Any], team: Optional[str], players: Optional[List[str]]) -> str:
+    """Pick the compared team of one match from a pair name or player names."""
+    if team:
+        for candidate in summary['teams']:
+            if candidate.lower() == team.lower():
+                return candidate
+        raise ComparisonError(f"Team '{team}' did not play this match (teams: {summary['teams']})")
+    if players:
+        wanted = {player.lower() for player in players}
+        for candidate in summary['teams']:
+            if wanted <= {player.lower() for player in summary['players'].get(candidate, [])}:
+                return candidate
+        raise ComparisonError(f"No team in this match has all of the players {players}")
+    return summary['teams'][0]
+
+
+def _side_metrics(summary: Dict[str, Any], side: str, players: Optional[List[str]]) -> Dict[str, Any]:
+    """Metrics of one side of one match, with counts, before alignment."""
+    opponent = next(team for team in summary['teams'] if team != side)
+    selected = {player.lower() for player in players} if players else None
+
+    we_by_set = {}
+    for set_key, counts in summary['weBySet'][side].items():
+        we_by_set[set_key] = {**counts, 'weRatio': _we_ratio(counts['winners'], counts['errors'])}
+
+    finishers = [
+        stats for name, stats in summary['finishing'].items()
+        if stats['team'] == side and (selected is None or name.lower() in selected)
+    ]
+    shots: Dict[str, Dict[str, int]] = {}
+    for stats in finishers:
+        for shot, counts in stats['shots'].items():
+            total = shots.setdefault(shot, {'total': 0, 'winners': 0, 'errors': 0})
+            for field in total:
+                total[field] += counts[field]
+    winners = sum(stats['winners'] for stats in finishers)
+    errors = sum(stats['errors'] for stats in finishers)
+
+    sequences = {}
+    for kind, counts in summary['sequences'][side].items():
+        total = sum(counts.values())
+        sequences[kind] = {sequence: _rate(count, total) for sequence, count in counts.items()}
+
+    total_points = sum(summary['points'].values())
+    return {
+        'team': side,
+        'opponent': opponent,
+        'metrics': {
+            'pointsWon': summary['points'][side],
+            'pointsWonRate': _rate(summary['points'][side], total_points),
+            'weBySet': we_by_set,
+            'finishing': {
+                'totalFinishes': sum(stats['totalFinishes'] for stats in finishers),
+                'winners': winners,
+                'errors': errors,
+                'weRatio': _we_ratio(winners, errors),
+                'shots': shots,
+            },
+            'sequenceFrequency': sequences,
+            'rallyLengthWinRate': {
+                category: _rate(counts['won'], counts['total'])
+                for category, counts in summary['rallyLength'][side].items()
+            },
+        },
+    }
+
+
+def _align(values: List[Any], fill: Any) -> List[Any]:
+    """Give every nested dict the union of keys, filling gaps with `fill`."""
+    if not any(isinstance(value, dict) for value in values):
+        return values
+    keys: List[str] = []
+    for value in values:
+        for key in value or {}:
+            if key not in keys:
+                keys.append(key)
+    columns = {key: _align([(value or {}).get(key, fill) for value in values], fill) for key in keys}
+    return [{key: columns[key][i] for key in keys} for i in range(len(values))]
+
+
+def _mean(values: List[Any]) -> Any:
+    if isinstance(values[0], dict):
+        return {key: _mean([value[key] for value in values]) for key in values[0]}
+    present = [value for value in values if value is not None]
+    return sum(present) / len(present) if present else None
+
+
+def _delta(value: Any, baseline: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _delta(value[key], baseline[key]) for key in value}
+    if value is None or baseline is None:
+        return None
+    return value - baseline
+
+
+def _top_sequences(metrics: List[Dict[str, Any]], top: int) -> None:
+    """Keep the sequences that are most frequent across all compared matches."""
+    for kind in ('winning', 'losing'):
+        totals: Dict[str, float] = {}
+        for entry in metrics:
+            for sequence, rate in entry['sequenceFrequency'].get(kind, {}).items():
+                totals[sequence] = totals.get(sequence, 0) + (rate or 0)
+        keep = set(sorted(totals, key=totals.get, reverse=True)[:top])
+        for entry in metrics:
+            frequencies = entry['sequenceFrequency'].get(kind, {})
+            entry['sequenceFrequency'][kind] = {
+                sequence: rate for sequence, rate in frequencies.items() if sequence in keep
+            }
+
+
+def compare_summaries(matches: Iterable[Dict[str, Any]], team: Optional[str] = None,
+                      players: Optional[List[str]] = None,
+                      top_sequences: int = DEFAULT_TOP_SEQUENCES) -> Dict[str, Any]:
+    """Align the metrics of one side across matches, with deltas to their mean.
+
+    `matches` are {'matchId', 'label', 'summary'} in the order to report. The
+    compared side of each match is `team`, else the team with all of
+    `players` (whose finishes alone are counted), else the first team.
+    """
+    sides = []
+    for match in matches:
+        try:
+            side = _resolve_side(match['summary'], team, players)
+        except ComparisonError as e:
+            raise ComparisonError(f"Match {match['matchId']}: {e}")
+        sides.append({
+            'matchId': match['matchId'],
+            'label': match.get('label', ''),
+            **_side_metrics(match['summary'], side, players),
+        })
+    if not sides:
+        raise ComparisonError("No matches to compare")
+
+    metrics = [side['metrics'] for side in sides]
+    _top_sequences(metrics, top_sequences)
+    # Counts missing from a match are zero; rates without a denominator stay None
+    aligned = _align(metrics, 0)
+    for set_key in SETS:
+        for entry in aligned:
+            counts = entry['weBySet'][set_key]
+            if counts['winners'] == 0 and counts['errors'] == 0:
+                counts['weRatio'] = None
+    mean = _mean(aligned)
+
+    return {
+        'team': team,
+        'players': players,
+        'matches': [
+            {**{key: side[key] for key in ('matchId', 'label', 'team', 'opponent')},
+             'metrics': entry, 'delta': _delta(entry, mean)}
+            for side, entry in zip(sides, aligned)
+        ],
+        'mean': mean,
+    }
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Results are compressed once and served many times, so favour ratio over speed
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 10
+
+# Encoder output is buffered into blocks of this size before being fed to
+# the compressors, so large results never need one contiguous JSON string.
+CHUNK_SIZE = 64 * 1024
+
+# Sections of the analysis a client may ask for via `include`
+ANALYSIS_SECTIONS = ('teams', 'players', 'rallies', 'statistics')
+
+# Preferred order when the client accepts several encodings equally
+ENCODING_PREFERENCE = ('br', 'gzip', 'identity')
+
+
+def analysis_cache_key(file_data: str, set_scores: Dict[str, Any], include: List[str]) -> str:
+    """Content-address an analysis by its CSV, set scores and included sections."""
+    digest = hashlib.sha256()
+    digest.update(file_data.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(set_scores, sort_keys=True).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(','.join(sorted(include)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _iter_json(data: Any) -> Iterator[bytes]:
+    """Encode `data` in blocks, byte-for-byte the same as DRF's JSONRenderer."""
+    encoder = JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    buffer = []
+    size = 0
+    for chunk in encoder.iterencode(data):
+        chunk = chunk.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def encode_result(data: Any) -> Dict[str, Any]:
+    """Render `data` to JSON once and produce every supported encoding of it.
+
+    The JSON is produced in blocks and streamed through the gzip (and, if
+    installed, brotli) compressors, so the bytes served later are computed
+    exactly once per result.
+    """
+    gzip_compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    brotli_compressor = brotli.Compressor(quality=BROTLI_QUALITY) if brotli else None
+    digest = hashlib.sha256()
+
+    identity, gzipped, brotlied = [], [], []
+    for block in _iter_json(data):
+        digest.update(block)
+        identity.append(block)
+        gzipped.append(gzip_compressor.compress(block))
+        if brotli_compressor:
+            brotlied.append(brotli_compressor.process(block))
+    gzipped.append(gzip_compressor.flush())
+
+    bodies = {
+        'identity': b''.join(identity),
+        'gzip': b''.join(gzipped),
+    }
+    if brotli_compressor:
+        brotlied.append(brotli_compressor.finish())
+        bodies['br'] = b''.join(brotlied)
+
+    return {'etag': digest.hexdigest()[:32], 'bodies': bodies}
+
+
+async def cache_encoded(cache, key: str, encoded: Dict[str, Any]):
+    """Store every body under its own key, then the entry that lists them.
+
+    A hit only reads the small entry and the one body it serves, which
+    matters with disk-backed caches that unpickle whole values.
+    """
+    await cache.aset_many({f'{key}:{coding}': body for coding, body in encoded['bodies'].items()})
+    await cache.aset(key, {'etag': encoded['etag'], 'codings': list(encoded['bodies'])})
+
+
+async def cached_encoded(cache, key: str, request) -> Optional[Dict[str, Any]]:
+    """The cached analysis with just the body `request` will be served, or None."""
+    entry = await cache.aget(key)
+    if entry is None:
+        return None
+    coding = select_encoding(request.META.get('HTTP_ACCEPT_ENCODING'), entry['codings'])
+    body = await cache.aget(f'{key}:{coding}')
+    if body is None:
+        return None  # Evicted on its own; treated as a miss
+    return {'etag': entry['etag'], 'bodies': {coding: body}}
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q-value}."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def select_encoding(header: Optional[str], available: Iterable[str]) -> str:
+    """Pick the best available content coding for an Accept-Encoding header."""
+    accepted = _parse_accept_encoding(header or '')
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = 'identity', 0.0
+    for coding in ENCODING_PREFERENCE:
+        if coding not in available:
+            continue
+        q = accepted.get(coding, 1.0 if coding == 'identity' else wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _etag_for(encoded: Dict[str, Any], coding: str) -> str:
+    """Each content coding is a distinct representation with its own strong ETag."""
+    if coding == 'identity':
+        return f'"{encoded["etag"]}"'
+    return f'"{encoded["etag"]}-{coding}"'
+
+
+def _if_none_match(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return etag in (tag[2:] if tag.startswith('W/') else tag for tag in candidates)
+
+
+def encoded_response(request, encoded: Dict[str, Any], conditional: bool = False,
+                     headers: Optional[Dict[str, str]] = None) -> HttpResponse:
+    """Serve precompressed bytes, answering If-None-Match with 304 when `conditional`."""
+    bodies = encoded['bodies']
+    coding = select_encoding(request.META.get('HTTP_ACCEPT_ENCODING'), bodies)
+    etag = _etag_for(encoded, coding)
+
+    if conditional and _if_none_match(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(bodies[coding], content_type='application/json')
+        if coding != 'identity':
+            response['Content-Encoding'] = coding
+        response['Content-Length'] = str(len(bodies[coding]))
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    for header, value in (headers or {}).items():
+        response[header] = value
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
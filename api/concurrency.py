@@ -0,0 +1,101 @@
+import asyncio
+import atexit
+import logging
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+class AnalysisUnavailable(RuntimeError):
+    """Raised when the executor broke (e.g. a child was OOM-killed) and the retry failed too."""
+
+
+def get_executor() -> Executor:
+    """Return the shared, bounded executor used for CPU-heavy match processing."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = settings.ANALYSIS_MAX_WORKERS
+                if settings.ANALYSIS_EXECUTOR == 'thread':
+                    _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis')
+                else:
+                    _executor = ProcessPoolExecutor(max_workers=max_workers)
+                logger.info(f"Started {settings.ANALYSIS_EXECUTOR} executor with {max_workers} workers")
+    return _executor
+
+
+def shutdown_executor():
+    """Shut the shared executor down (registered for worker exit; also used in tests)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+# Don't let a stopping server worker wait for queued analyses
+atexit.register(shutdown_executor)
+
+
+def _discard_executor(broken: Executor):
+    """Drop a broken executor so the next call starts a fresh one."""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def run_in_executor(func: Callable, *args: Any) -> Any:
+    """Run `func(*args)` on the shared executor without blocking the event loop.
+
+    If a pool child dies, the pool is replaced and the call retried once;
+    a second failure raises AnalysisUnavailable.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = get_executor()
+        try:
+            return await loop.run_in_executor(executor, partial(func, *args))
+        except BrokenProcessPool as e:
+            logger.error(f"Analysis process pool broke ({str(e)}), starting a new one")
+            _discard_executor(executor)
+            if attempt:
+                raise AnalysisUnavailable('Analysis workers are restarting') from e
+
+
+class AdmissionController:
+    """Counts in-flight analysis requests and refuses new ones over the limit.
+
+    A plain lock-protected counter is used instead of an asyncio primitive:
+    under WSGI every async view runs in its own event loop, so loop-bound
+    semaphores would not be shared between requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= settings.ANALYSIS_MAX_IN_FLIGHT:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+admission = AdmissionController()
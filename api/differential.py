@@ -0,0 +1,239 @@
+"""
+Differential equivalence harness between the frozen reference processor
+(api/reference.py) and the optimized engines of MatchDataProcessor.
+
+Random valid and edge-case tagging exports are generated from a seed, run
+through every engine, and the outputs compared as rendered JSON, so any
+divergence (including in the reference's quirks) is reported with the seed
+and the first differing path.
+"""
+import contextlib
+import io
+import json
+import random
+import time
+from io import StringIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from rest_framework.utils.encoders import JSONEncoder
+
+from .reference import ReferenceMatchDataProcessor
+from .synthetic import generate_match_csv
+from .utils import ENGINES, MatchDataProcessor
+
+REFERENCE = 'reference'
+
+# Derived from the compared rallies by api/win_probability.py and tested there
+UNCOMPARED_STATISTIC = 'winProbability'
+
+# A generated case: (name, CSV content, set scores)
+Case = Tuple[str, str, Dict[str, Dict[str, int]]]
+
+
+def _rows(df: pd.DataFrame, rng: random.Random, row_filter) -> List[int]:
+    labels = df.index[row_filter].tolist()
+    return rng.sample(labels, min(len(labels), rng.randint(1, 3))) if labels else []
+
+
+def _team_rows(df: pd.DataFrame):
+    return df['OUTCOME'].isin(['WINNER', 'ERROR'])
+
+
+def _shot_rows(df: pd.DataFrame):
+    return df['Row'].ne('RALLY') & ~_team_rows(df)
+
+
+def _shots_before_first_rally(df, rng):
+    first = pd.to_numeric(df['Start time']).min()
+    extra = df[_shot_rows(df)].head(rng.randint(1, 3)).copy()
+    extra['Start time'] = [first - 1 - i for i in range(len(extra))]
+    return pd.concat([df, extra], ignore_index=True)
+
+
+def _rally_without_outcome(df, rng):
+    return df.drop(index=_rows(df, rng, _team_rows(df)))
+
+
+def _rally_with_two_outcomes(df, rng):
+    extra = df.loc[_rows(df, rng, _team_rows(df))].copy()
+    extra['OUTCOME'] = extra['OUTCOME'].map({'WINNER': 'ERROR', 'ERROR': 'WINNER'})
+    extra['Start time'] = extra['Start time'] + 0.001
+    return pd.concat([df, extra], ignore_index=True)
+
+
+def _serve_only_rallies(df, rng):
+    df = df.copy()
+    df.loc[_rows(df, rng, _shot_rows(df)), 'Row'] = 'SERVE'
+    return df
+
+
+def _receive_serves(df, rng):
+    df = df.copy()
+    df.loc[_rows(df, rng, _shot_rows(df)), 'Row'] = 'RECEIVE SERVES'
+    return df
+
+
+def _unknown_players(df, rng):
+    df = df.copy()
+    df.loc[_rows(df, rng, _shot_rows(df)), "PLAYER'S NAME"] = 'UNKNOWN PLAYER'
+    return df
+
+
+def _shots_without_player(df, rng):
+    df = df.copy()
+    df.loc[_rows(df, rng, _shot_rows(df)), "PLAYER'S NAME"] = None
+    return df
+
+
+def _missing_stroke_and_direction(df, rng):
+    df = df.copy()
+    df.loc[_rows(df, rng, _shot_rows(df)), 'Stroke'] = None
+    df.loc[_rows(df, rng, _shot_rows(df)), 'Shot Direction'] = None
+    return df
+
+
+def _no_errors(df, rng):
+    # Every outcome becomes a winner, so weRatio takes its zero-errors branch
+    df = df.copy()
+    df.loc[_team_rows(df), 'OUTCOME'] = 'WINNER'
+    return df
+
+
+def _tied_start_times(df, rng):
+    df = df.copy()
+    for label in _rows(df, rng, _shot_rows(df)):
+        df.loc[label, 'Start time'] = df['Start time'].iloc[rng.randrange(len(df))]
+    return df
+
+
+def _third_team(df, rng):
+    df = df.copy()
+    df.loc[_rows(df, rng, _team_rows(df)), 'Row'] = 'THIRD TEAM'
+    return df
+
+
+EDGE_CASES: Dict[str, Callable[[pd.DataFrame, random.Random], pd.DataFrame]] = {
+    'shots_before_first_rally': _shots_before_first_rally,
+    'rally_without_outcome': _rally_without_outcome,
+    'rally_with_two_outcomes': _rally_with_two_outcomes,
+    'serve_only_rallies': _serve_only_rallies,
+    'receive_serves': _receive_serves,
+    'unknown_players': _unknown_players,
+    'shots_without_player': _shots_without_player,
+    'missing_stroke_and_direction': _missing_stroke_and_direction,
+    'no_errors': _no_errors,
+    'tied_start_times': _tied_start_times,
+    'third_team': _third_team,
+}
+
+SET_SCORE_VARIANTS = [
+    {'set1': {}, 'set2': {}},
+    {'set1': {}, 'set2': {}, 'set3': {}},
+]
+
+
+def generate_case(seed: int, edge_cases: bool = True) -> Case:
+    """Build one random tagging export (optionally with edge-case mutations) from a seed."""
+    rng = random.Random(seed)
+    content = generate_match_csv(
+        rallies=rng.choice([None, rng.randint(1, 40), rng.randint(60, 160)]),
+        max_shots=rng.randint(1, 10),
+        seed=seed,
+        team1_point_win=rng.uniform(0.3, 0.7),
+        named_outcomes=rng.random() < 0.8,
+    )
+    name = 'valid'
+    if edge_cases and rng.random() < 0.7:
+        names = rng.sample(sorted(EDGE_CASES), rng.randint(1, 3))
+        content = apply_edge_cases(content, names, rng)
+        name = '+'.join(names)
+    return name, content, rng.choice(SET_SCORE_VARIANTS)
+
+
+def apply_edge_cases(content: str, names: List[str], rng: random.Random) -> str:
+    """Apply the named EDGE_CASES mutations to a tagging export."""
+    df = pd.read_csv(StringIO(content))
+    for name in names:
+        df = EDGE_CASES[name](df, rng)
+    return df.to_csv(index=False)
+
+
+def run_engine(engine: str, content: str, set_scores: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    """Run one engine, capturing its result or the exception it raised."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            if engine == REFERENCE:
+                result = ReferenceMatchDataProcessor(StringIO(content)).process_match_data(set_scores)
+            else:
+                result = MatchDataProcessor(StringIO(content)).process_match_data(set_scores, engine=engine)
+                # Not part of the frozen reference; see WinProbabilityTests
+                result.get('statistics', {}).pop(UNCOMPARED_STATISTIC, None)
+            return {'result': result}
+        except Exception as e:
+            return {'error': f'{type(e).__name__}: {e}'}
+
+
+def canonical(outcome: Dict[str, Any]) -> str:
+    """Render an engine outcome the way the API would, keeping key order and NaNs."""
+    return json.dumps(outcome, cls=JSONEncoder, ensure_ascii=False, allow_nan=True)
+
+
+def first_difference(expected: Any, actual: Any, path: str = '$') -> Optional[str]:
+    """Describe the first place where two JSON-like structures differ."""
+    if type(expected) != type(actual):
+        return f'{path}: type {type(expected).__name__} != {type(actual).__name__}'
+    if isinstance(expected, dict):
+        if list(expected) != list(actual):
+            return f'{path}: keys {list(expected)} != {list(actual)}'
+        for key in expected:
+            difference = first_difference(expected[key], actual[key], f'{path}.{key}')
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, list):
+        if len(expected) != len(actual):
+            return f'{path}: length {len(expected)} != {len(actual)}'
+        for index, (a, b) in enumerate(zip(expected, actual)):
+            difference = first_difference(a, b, f'{path}[{index}]')
+            if difference:
+                return difference
+        return None
+    if expected != actual and not (expected != expected and actual != actual):
+        return f'{path}: {expected!r} != {actual!r}'
+    return None
+
+
+def compare_engines(content: str, set_scores: Dict[str, Dict[str, int]],
+                    engines=ENGINES) -> Dict[str, str]:
+    """Return {engine: first difference} for every engine that diverges from the reference."""
+    expected = json.loads(canonical(run_engine(REFERENCE, content, set_scores)))
+    mismatches = {}
+    for engine in engines:
+        actual = json.loads(canonical(run_engine(engine, content, set_scores)))
+        difference = first_difference(expected, actual)
+        if difference:
+            mismatches[engine] = difference
+    return mismatches
+
+
+def benchmark(cases: List[Case], engines=ENGINES, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """Time every engine over the same cases; speedup is relative to the reference."""
+    timings = {}
+    for engine in (REFERENCE, *engines):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _, content, set_scores in cases:
+                run_engine(engine, content, set_scores)
+            best = min(best, time.perf_counter() - start)
+        timings[engine] = best
+
+    return {
+        engine: {
+            'seconds': round(seconds, 4),
+            'per_case_ms': round(seconds / len(cases) * 1000, 3) if cases else 0.0,
+            'speedup': round(timings[REFERENCE] / seconds, 2) if seconds else float('inf'),
+        }
+        for engine, seconds in timings.items()
+    }
@@ -0,0 +1,258 @@
+import csv
+from io import StringIO
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .utils import analyze_match_csv, load_validated_csv
+from .validation import MatchDataError
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; CSV export always works
+    pa = None
+
+EXPORT_FORMATS = ('parquet', 'arrow', 'csv')
+
+# Column layout of every exported table: (name, arrow type name)
+TABLE_COLUMNS = {
+    'rallies': [
+        ('match_id', 'string'),
+        ('rally_number', 'int64'),
+        ('set', 'int64'),
+        ('team1', 'string'),
+        ('team2', 'string'),
+        ('team1_score', 'int64'),
+        ('team2_score', 'int64'),
+        ('start_time', 'float64'),
+        ('duration', 'float64'),
+        ('shot_count', 'int64'),
+        ('point_winner', 'string'),
+        ('outcome_team', 'string'),
+        ('outcome_type', 'string'),
+        ('outcome_time', 'float64'),
+    ],
+    'shots': [
+        ('match_id', 'string'),
+        ('rally_number', 'int64'),
+        ('shot_index', 'int64'),
+        ('type', 'string'),
+        ('player', 'string'),
+        ('stroke', 'string'),
+        ('direction', 'string'),
+        ('time', 'float64'),
+    ],
+    # Statistics are exported in long form: one row per (scope, team, player, metric)
+    'statistics': [
+        ('match_id', 'string'),
+        ('scope', 'string'),
+        ('team', 'string'),
+        ('player', 'string'),
+        ('metric', 'string'),
+        ('value', 'float64'),
+    ],
+}
+
+# Default set scores for bulk export: allow a third set whenever one was played
+DEFAULT_SET_SCORES = {'set1': {}, 'set2': {}, 'set3': {}}
+
+# A match to export: (match_id, CSV content, set scores)
+ExportMatch = Tuple[str, str, Dict[str, Dict[str, int]]]
+
+
+def _int(value) -> Optional[int]:
+    return None if value is None or value != value else int(value)
+
+
+def _float(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def rally_rows(match_id: str, analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten the rallies produced by MatchDataProcessor into table rows."""
+    team1, team2 = analysis['teams']
+    rows = []
+    for rally in analysis['rallies']:
+        outcome = rally['outcome'] or {}
+        team1_score, team2_score = (None, None)
+        if rally.get('score'):
+            team1_score, team2_score = (int(score) for score in rally['score'].split('-'))
+        rows.append({
+            'match_id': match_id,
+            'rally_number': _int(rally['number']),
+            'set': _int(rally.get('set')),
+            'team1': team1,
+            'team2': team2,
+            'team1_score': team1_score,
+            'team2_score': team2_score,
+            'start_time': _float(rally['startTime']),
+            'duration': _float(rally['duration']),
+            'shot_count': len(rally['shots']),
+            'point_winner': outcome.get('pointWinner'),
+            'outcome_team': outcome.get('outcomeTeam'),
+            'outcome_type': outcome.get('type'),
+            'outcome_time': _float(outcome.get('time')),
+        })
+    return rows
+
+
+def shot_rows(match_id: str, analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten every rally's shots into table rows."""
+    return [
+        {
+            'match_id': match_id,
+            'rally_number': _int(rally['number']),
+            'shot_index': index,
+            'type': shot['type'],
+            'player': shot['player'],
+            'stroke': shot['stroke'],
+            'direction': shot['direction'],
+            'time': shot['time'],
+        }
+        for rally in analysis['rallies']
+        for index, shot in enumerate(rally['shots'], 1)
+    ]
+
+
+def statistics_rows(match_id: str, analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Normalize the nested statistics dict into long-form metric rows."""
+    statistics = analysis['statistics']
+    rows = []
+
+    def add(scope, metric, value, team=None, player=None):
+        rows.append({
+            'match_id': match_id,
+            'scope': scope,
+            'team': team,
+            'player': player,
+            'metric': metric,
+            'value': _float(value),
+        })
+
+    add('match', 'totalRallies', statistics['totalRallies'])
+    for set_number in (1, 2, 3):
+        add(f'set{set_number}', 'rallies', statistics[f'set{set_number}Count'])
+
+    for team in analysis['teams']:
+        add('match', 'points', statistics[f'{team}Points'], team=team)
+        for set_key, teams in statistics['setWeAnalysis'].items():
+            for metric, value in teams[team.lower()].items():
+                add(set_key, metric, value, team=team)
+        for category, outcomes in statistics['rallyLengthByOutcome'].items():
+            add(f'rallyLength:{category}', 'pointsWon', outcomes[team.lower()], team=team)
+            if f'{team.lower()}_percentage' in outcomes:
+                add(f'rallyLength:{category}', 'pointsWonPercentage',
+                    outcomes[f'{team.lower()}_percentage'], team=team)
+
+    for player in statistics['finishingPlayers']:
+        for metric in ('totalFinishes', 'winners', 'errors', 'weRatio'):
+            add('match', metric, player[metric], team=player['team'], player=player['name'])
+        for breakdown in player['shotBreakdownArray']:
+            for metric in ('total', 'winners', 'errors', 'successRate'):
+                add(f"finish:{breakdown['shot']}", metric, breakdown[metric],
+                    team=player['team'], player=player['name'])
+
+    return rows
+
+
+TABLE_BUILDERS = {
+    'rallies': rally_rows,
+    'shots': shot_rows,
+    'statistics': statistics_rows,
+}
+
+
+def iter_match_tables(matches: Iterable[ExportMatch], tables: Iterable[str]) -> Iterator[Dict[str, List[Dict]]]:
+    """Analyze matches one at a time, yielding only that match's table rows.
+
+    Only one match's analysis is alive at any point, which keeps memory
+    bounded no matter how many matches go into an export.
+    """
+    for match_id, content, set_scores in matches:
+        analysis = analyze_match_csv(content, set_scores)
+        yield {table: TABLE_BUILDERS[table](match_id, analysis) for table in tables}
+
+
+def arrow_schema(table: str):
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in TABLE_COLUMNS[table]])
+
+
+def write_columnar(matches: Iterable[ExportMatch], paths: Dict[str, str], fmt: str):
+    """Write each requested table to its path as Parquet or Arrow IPC.
+
+    Every match becomes one Parquet row group / Arrow record batch, written
+    as soon as that match is processed.
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Parquet/Arrow export; use the csv format instead")
+    if fmt not in ('parquet', 'arrow'):
+        raise ValueError(f"Unsupported columnar format: {fmt}")
+
+    schemas = {table: arrow_schema(table) for table in paths}
+    writers = {}
+    try:
+        for table, path in paths.items():
+            if fmt == 'parquet':
+                writers[table] = pq.ParquetWriter(path, schemas[table], compression='zstd')
+            else:
+                writers[table] = pa.ipc.new_file(path, schemas[table])
+
+        for match_tables in iter_match_tables(matches, list(paths)):
+            for table, rows in match_tables.items():
+                if rows:
+                    writers[table].write_table(pa.Table.from_pylist(rows, schema=schemas[table]))
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+
+def iter_csv(matches: Iterable[ExportMatch], table: str, header: bool = True) -> Iterator[str]:
+    """Stream one table as CSV text, optionally a header, then one chunk per match."""
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=[name for name, _ in TABLE_COLUMNS[table]])
+
+    if header:
+        writer.writeheader()
+        yield buffer.getvalue()
+
+    for match_tables in iter_match_tables(matches, [table]):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(match_tables[table])
+        yield buffer.getvalue()
+
+
+def write_csv(matches: Iterable[ExportMatch], paths: Dict[str, str]):
+    """Write each requested table to its path as CSV in a single pass over the matches."""
+    files = {}
+    try:
+        writers = {}
+        for table, path in paths.items():
+            files[table] = open(path, 'w', newline='', encoding='utf-8')
+            writers[table] = csv.DictWriter(files[table], fieldnames=[name for name, _ in TABLE_COLUMNS[table]])
+            writers[table].writeheader()
+
+        for match_tables in iter_match_tables(matches, list(paths)):
+            for table, rows in match_tables.items():
+                writers[table].writerows(rows)
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def validate_matches(matches: Iterable[ExportMatch]):
+    """Validate every match before anything is exported, raising MatchDataError for the first bad one."""
+    for match_id, content, _ in matches:
+        try:
+            load_validated_csv(content)
+        except MatchDataError as e:
+            raise MatchDataError(f"Match {match_id}: {e}", e.report)
+
+
+def csv_header(table: str) -> str:
+    return ','.join(name for name, _ in TABLE_COLUMNS[table]) + '\r\n'
+
+
+def csv_chunk(match: ExportMatch, table: str) -> str:
+    """CSV rows (without header) of one table for a single match."""
+    return ''.join(iter_csv([match], table, header=False))
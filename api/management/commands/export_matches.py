@@ -0,0 +1,49 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import DEFAULT_SET_SCORES, EXPORT_FORMATS, TABLE_COLUMNS, write_columnar, write_csv
+from api.validation import MatchDataError
+
+
+class Command(BaseCommand):
+    help = "Export rally, shot and statistics tables for many tagging CSVs as Parquet, Arrow or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_files', nargs='+', help="Tagging exports; the file stem is used as match_id")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='parquet')
+        parser.add_argument('--output-dir', default='.', help="Directory for <table>.<format> files")
+        parser.add_argument('--tables', nargs='+', choices=list(TABLE_COLUMNS), default=list(TABLE_COLUMNS))
+        parser.add_argument('--set-scores', default=json.dumps(DEFAULT_SET_SCORES),
+                            help="JSON set scores applied to every match")
+
+    def handle(self, *args, **options):
+        try:
+            set_scores = json.loads(options['set_scores'])
+        except ValueError as e:
+            raise CommandError(f"Invalid --set-scores: {e}")
+
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        fmt = options['format']
+        paths = {table: str(output_dir / f'{table}.{fmt}') for table in options['tables']}
+
+        def matches():
+            # Files are read lazily so only one match is held in memory at a time
+            for path in map(Path, options['csv_files']):
+                self.stderr.write(f"Exporting {path}")
+                yield path.stem, path.read_text(encoding='utf-8'), set_scores
+
+        try:
+            if fmt == 'csv':
+                write_csv(matches(), paths)
+            else:
+                write_columnar(matches(), paths, fmt)
+        except MatchDataError as e:
+            raise CommandError(f"{e}: {json.dumps(e.report['errors'])}")
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        for path in paths.values():
+            self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
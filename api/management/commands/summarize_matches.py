@@ -0,0 +1,42 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.comparison import build_match_summary, match_summary_id
+from api.export import DEFAULT_SET_SCORES
+from api.models import MatchSummary
+from api.utils import analyze_match_csv
+from api.validation import MatchDataError
+
+
+class Command(BaseCommand):
+    help = "Store comparison summaries for tagging CSVs so /api/compare/ can use them without re-analysis."
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_files', nargs='+', help="Tagging exports; the file stem is used as label")
+        parser.add_argument('--set-scores', default=json.dumps(DEFAULT_SET_SCORES),
+                            help="JSON set scores applied to every match")
+
+    def handle(self, *args, **options):
+        try:
+            set_scores = json.loads(options['set_scores'])
+        except ValueError as e:
+            raise CommandError(f"Invalid --set-scores: {e}")
+
+        for path in map(Path, options['csv_files']):
+            content = path.read_text(encoding='utf-8')
+            try:
+                summary = build_match_summary(
+                    analyze_match_csv(content, set_scores, store_dir=settings.MATCH_STORE_DIR)
+                )
+            except MatchDataError as e:
+                raise CommandError(f"{path}: {e}: {json.dumps(e.report['errors'])}")
+
+            match_id = match_summary_id(content, set_scores)
+            MatchSummary.objects.update_or_create(
+                match_id=match_id,
+                defaults={'label': path.stem[:255], 'teams': summary['teams'], 'summary': summary},
+            )
+            self.stdout.write(self.style.SUCCESS(f"{match_id} {path.stem}"))
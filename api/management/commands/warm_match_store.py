@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.match_store import match_key, open_match_store
+from api.utils import DEFAULT_ENGINE, ENGINES, MatchDataProcessor, load_validated_csv
+from api.validation import MatchDataError
+
+
+class Command(BaseCommand):
+    help = "Parse tagging CSVs once into the shared match store so every worker on this host can map them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_files', nargs='+', help="Tagging exports to parse")
+        parser.add_argument('--store-dir', default=settings.MATCH_STORE_DIR,
+                            help="Store directory (defaults to MATCH_STORE_DIR)")
+        parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE)
+
+    def handle(self, *args, **options):
+        store = open_match_store(options['store_dir'], settings.MATCH_STORE_MAX_BYTES)
+        if store is None:
+            raise CommandError("The match store needs pyarrow and a usable store directory")
+
+        for path in map(Path, options['csv_files']):
+            content = path.read_text(encoding='utf-8')
+            key = match_key(content)
+            if key in store:
+                self.stdout.write(f"{key} {path.name} (already stored)")
+                continue
+            try:
+                df, _ = load_validated_csv(content)
+            except MatchDataError as e:
+                raise CommandError(f"{path}: {e}")
+            processor = MatchDataProcessor(df)
+            if store.put(key, processor.teams, processor.players, processor.build_rallies(options['engine'])):
+                self.stdout.write(self.style.SUCCESS(f"{key} {path.name}"))
+            else:
+                self.stderr.write(f"{key} {path.name} could not be stored")
+
+        self.stdout.write(f"{len(store)} matches in {store.directory}")
@@ -0,0 +1,313 @@
+"""
+Host-wide, read-only cache of parsed matches in memory-mapped Arrow files.
+
+The rallies and shots MatchDataProcessor builds from a tagging export are
+appended once, each as an Arrow IPC stream, to the rallies and shots
+data files in the store directory. index.jsonl maps every match (a digest
+of its CSV) to the byte ranges of its two streams, plus its teams and
+players. Every worker process maps the same files read-only, so the pages
+are shared through the page cache: a match parsed by any worker, or by
+`manage.py warm_match_store`, is ready in all of them and resident memory
+does not grow with the number of workers.
+
+Writers serialize on an flock()ed lock file and append the data before the
+index line, so readers never see an entry whose bytes are not on disk yet.
+An index line torn by a crashed writer is terminated by the next writer and
+skipped by readers.
+
+The index's first line names the generation and the STORE_VERSION it was
+written with. Once the data files would exceed `max_bytes`, or the version
+differs from this code's, the next writer starts a new generation: fresh
+data files and a new index. Entries of another version are never served.
+Processes notice the replaced index and drop their entries; maps of the old
+files stay valid until released, and matches that are gone are simply
+parsed from CSV again.
+
+The store is only a cache: every I/O or decoding failure is logged and the
+caller falls back to parsing the CSV.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pyarrow is optional; without it every match is parsed from CSV
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.jsonl'
+LOCK_FILE = '.lock'
+TABLES = ('rallies', 'shots')
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Bump whenever the engines build different rallies from the same CSV or the
+# Arrow layout below changes; stores written by other versions are replaced
+STORE_VERSION = 1
+
+RALLY_FIELDS = ('number', 'startTime', 'duration')
+OUTCOME_FIELDS = ('pointWinner', 'outcomeTeam', 'type', 'time')
+SHOT_FIELDS = ('type', 'player', 'stroke', 'direction', 'time')
+
+
+@dataclass
+class StoredMatch:
+    teams: List[str]
+    players: Dict[str, List[str]]
+    rallies: List[Dict[str, Any]]
+
+
+def match_key(content: str) -> str:
+    """Identify a parsed match by its CSV content (set scores are applied later)."""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _plain(value: Any) -> Any:
+    """Replace NumPy scalars with the Python values Arrow round-trips exactly."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _to_tables(rallies: List[Dict[str, Any]]) -> Tuple['pa.Table', 'pa.Table']:
+    rally_columns: Dict[str, list] = {field: [] for field in RALLY_FIELDS}
+    rally_columns.update({f'outcome.{field}': [] for field in OUTCOME_FIELDS})
+    rally_columns['hasOutcome'] = []
+    rally_columns['shotCount'] = []
+    shot_columns: Dict[str, list] = {field: [] for field in SHOT_FIELDS}
+
+    for rally in rallies:
+        for field in RALLY_FIELDS:
+            rally_columns[field].append(rally[field])
+        outcome = rally['outcome']
+        rally_columns['hasOutcome'].append(outcome is not None)
+        for field in OUTCOME_FIELDS:
+            rally_columns[f'outcome.{field}'].append(outcome[field] if outcome else None)
+        rally_columns['shotCount'].append(len(rally['shots']))
+        for shot in rally['shots']:
+            for field in SHOT_FIELDS:
+                shot_columns[field].append(shot[field])
+
+    return pa.table(rally_columns), pa.table(shot_columns)
+
+
+def _from_tables(rally_table: 'pa.Table', shot_table: 'pa.Table') -> List[Dict[str, Any]]:
+    rally_columns = {name: rally_table.column(name).to_pylist() for name in rally_table.column_names}
+    shot_columns = [shot_table.column(field).to_pylist() for field in SHOT_FIELDS]
+    shots = [dict(zip(SHOT_FIELDS, values)) for values in zip(*shot_columns)]
+
+    rallies = []
+    position = 0
+    for i, shot_count in enumerate(rally_columns['shotCount']):
+        # Same key order as the engines build, so rendered JSON is identical
+        rally = {field: rally_columns[field][i] for field in RALLY_FIELDS}
+        rally['shots'] = shots[position:position + shot_count]
+        rally['outcome'] = {
+            field: rally_columns[f'outcome.{field}'][i] for field in OUTCOME_FIELDS
+        } if rally_columns['hasOutcome'][i] else None
+        rally['set'] = None
+        rallies.append(rally)
+        position += shot_count
+    return rallies
+
+
+def _serialize(table: 'pa.Table') -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def data_file(table: str, generation: int) -> str:
+    # Generation 0 keeps the names of stores written before generations existed
+    return f'{table}.arrows' if generation == 0 else f'{table}.{generation}.arrows'
+
+
+class MatchStore:
+    """Append-only store of parsed matches shared by every process on the host."""
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self, inode: Optional[int] = None):
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._index_inode = inode
+        self._index_position = 0
+        self._generation = 0
+        self._version = None  # Stores from before versioning have no header
+        self._maps: Dict[Tuple[str, int], Any] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _refresh_index(self):
+        """Read index lines appended since the last refresh (by any process)."""
+        try:
+            with open(self._path(INDEX_FILE), 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self._index_inode:
+                    # A new generation (or the first read): start over
+                    self._reset(inode)
+                f.seek(self._index_position)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # A line still being written
+                    self._index_position += len(line)
+                    try:
+                        entry = json.loads(line)
+                        if 'generation' in entry and 'match' not in entry:
+                            self._generation = entry['generation']
+                            self._version = entry.get('version')
+                        elif self._version == STORE_VERSION:
+                            self._index[entry['match']] = entry
+                    except (ValueError, TypeError, KeyError):
+                        logger.warning(f"Skipping unreadable match store index line: {line[:80]!r}")
+        except FileNotFoundError:
+            pass
+
+    def _read(self, table: str, generation: int, offset: int, length: int) -> 'pa.Table':
+        mapped = self._maps.get((table, generation))
+        if mapped is None or mapped.size() < offset + length:
+            # The file grew since it was mapped; map it again to see the new pages
+            mapped = pa.memory_map(self._path(data_file(table, generation)), 'r')
+            self._maps[(table, generation)] = mapped
+        # Zero-copy: the batches reference the shared, read-only mapped pages
+        return pa.ipc.open_stream(mapped.read_at(length, offset)).read_all()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._index:
+                self._refresh_index()
+            return key in self._index
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh_index()
+            return len(self._index)
+
+    def get(self, key: str) -> Optional[StoredMatch]:
+        """Return the parsed match for `key`, or None if it is not (readably) stored."""
+        try:
+            with self._lock:
+                if key not in self._index:
+                    self._refresh_index()
+                entry = self._index.get(key)
+                if entry is None:
+                    return None
+                generation = entry.get('generation', 0)
+                rally_table = self._read('rallies', generation, *entry['rallies'])
+                shot_table = self._read('shots', generation, *entry['shots'])
+            return StoredMatch(entry['teams'], entry['players'], _from_tables(rally_table, shot_table))
+        except (OSError, ValueError, KeyError, TypeError, pa.ArrowException) as e:
+            logger.warning(f"Could not read match {key} from the match store: {str(e)}")
+            return None
+
+    def put(self, key: str, teams: List[str], players: Dict[str, List[str]],
+            rallies: List[Dict[str, Any]]) -> bool:
+        """Store freshly built rallies (before sets are assigned); False if skipped."""
+        rallies = _plain(rallies)
+        try:
+            rally_table, shot_table = _to_tables(rallies)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            logger.info(f"Not storing match {key}: {str(e)}")
+            return False
+        # Only store what reads back exactly, so cached and fresh analyses never differ
+        if repr(_from_tables(rally_table, shot_table)) != repr(rallies):
+            logger.info(f"Not storing match {key}: rallies do not round-trip through Arrow")
+            return False
+        blobs = {'rallies': _serialize(rally_table), 'shots': _serialize(shot_table)}
+
+        try:
+            with open(self._path(LOCK_FILE), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                with self._lock:
+                    self._refresh_index()
+                    if key in self._index:
+                        return True
+                    full = self._index and self._data_size() + sum(map(len, blobs.values())) > self.max_bytes
+                    if full or self._version != STORE_VERSION:
+                        self._start_generation()
+                    entry = {'match': key, 'generation': self._generation,
+                             'teams': _plain(teams), 'players': _plain(players)}
+                    for table, blob in blobs.items():
+                        with open(self._path(data_file(table, self._generation)), 'ab') as f:
+                            entry[table] = [f.tell(), len(blob)]
+                            f.write(blob)
+                    with open(self._path(INDEX_FILE), 'ab') as f:
+                        # Terminate a line torn by a writer that died part-way
+                        if f.tell() and not self._ends_with_newline():
+                            f.write(b'\n')
+                        f.write(json.dumps(entry).encode('utf-8') + b'\n')
+        except OSError as e:
+            logger.warning(f"Not storing match {key}: {str(e)}")
+            return False
+        return True
+
+    def _data_size(self) -> int:
+        size = 0
+        for table in TABLES:
+            try:
+                size += os.path.getsize(self._path(data_file(table, self._generation)))
+            except FileNotFoundError:
+                pass
+        return size
+
+    def _ends_with_newline(self) -> bool:
+        with open(self._path(INDEX_FILE), 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _start_generation(self):
+        """Replace the index and data files when full or of another version (lock held)."""
+        old, generation = self._generation, self._generation + 1
+        logger.info(f"Starting generation {generation} of match store {self.directory} "
+                    f"(version {self._version} -> {STORE_VERSION}, {len(self._index)} matches dropped)")
+        temporary = self._path(f'{INDEX_FILE}.tmp')
+        with open(temporary, 'wb') as f:
+            f.write(json.dumps({'generation': generation, 'version': STORE_VERSION}).encode('utf-8') + b'\n')
+        os.replace(temporary, self._path(INDEX_FILE))
+        # Processes that still map the old files keep their pages until they refresh
+        for table in TABLES:
+            try:
+                os.unlink(self._path(data_file(table, old)))
+            except FileNotFoundError:
+                pass
+        self._refresh_index()
+
+
+_stores: Dict[Tuple[int, str], Optional[MatchStore]] = {}
+_stores_lock = threading.Lock()
+
+
+def open_match_store(directory: Optional[str], max_bytes: int = DEFAULT_MAX_BYTES) -> Optional[MatchStore]:
+    """This process's view of the store in `directory`; None if disabled, unusable or pyarrow is missing."""
+    if not directory or pa is None:
+        return None
+    # Keyed by pid so forked executor workers map the files themselves
+    key = (os.getpid(), directory)
+    with _stores_lock:
+        if key not in _stores:
+            try:
+                _stores[key] = MatchStore(directory, max_bytes)
+            except OSError as e:
+                # Remembered, so the failure is logged once per process
+                logger.warning(f"Match store disabled, cannot use {directory}: {str(e)}")
+                _stores[key] = None
+        return _stores[key]
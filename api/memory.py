@@ -0,0 +1,228 @@
+"""
+Opt-in per-request memory accounting.
+
+With ANALYSIS_MEMORY_PROFILING enabled, every analysis stage wrapped in
+memory_stage() records its peak traced memory, the memory it retained and
+its top allocation sites (via tracemalloc), and every request records the
+peak RSS of the process that did the work. Attribution is exact with the
+process executor, where a worker runs one request at a time; with the
+thread executor concurrent requests share one tracemalloc trace.
+
+The kernel's peak RSS counter is per process, so it is only reset (and the
+peak reported as per-request) in executor processes that run one request at
+a time; elsewhere resetting it would clobber concurrent requests' peaks.
+"""
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+_current_profile: ContextVar[Optional['MemoryProfile']] = ContextVar('memory_profile', default=None)
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def _read_status_kb(field: str) -> Optional[int]:
+    """Read a VmRSS/VmHWM style field of /proc/self/status in KB (Linux only)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS (VmHWM) counter for this process, if supported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb() -> Optional[int]:
+    peak = _read_status_kb('VmHWM')
+    if peak is None:
+        try:
+            import resource
+            # Lifetime peak in KB on Linux; only an upper bound per request
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except (ImportError, OSError):
+            return None
+    return peak
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+
+
+class MemoryProfile:
+    """Collects per-stage tracemalloc measurements for one request."""
+
+    def __init__(self, top: int = 5, reset_peak_rss: bool = False):
+        self.top = top
+        self.stages: List[Dict[str, Any]] = []
+        self.pid = os.getpid()
+        self.rss_start_kb = _read_status_kb('VmRSS')
+        self.peak_rss_reset = reset_peak_rss and _reset_peak_rss()
+
+    @contextmanager
+    def stage(self, name: str):
+        before = tracemalloc.take_snapshot() if self.top else None
+        current_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            current_after, peak = tracemalloc.get_traced_memory()
+            entry = {
+                'stage': name,
+                'peakTracedKB': round(peak / 1024, 1),
+                'allocatedKB': round(max(peak - current_before, 0) / 1024, 1),
+                'retainedKB': round((current_after - current_before) / 1024, 1),
+                'seconds': round(time.perf_counter() - started, 4),
+            }
+            if before is not None:
+                entry['topAllocations'] = self._top_allocations(before)
+            self.stages.append(entry)
+
+    def _top_allocations(self, before) -> List[Dict[str, Any]]:
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        after = tracemalloc.take_snapshot().filter_traces(filters)
+        differences = after.compare_to(before.filter_traces(filters), 'lineno')
+        return [
+            {
+                'site': f'{diff.traceback[0].filename}:{diff.traceback[0].lineno}',
+                'sizeKB': round(diff.size_diff / 1024, 1),
+                'count': diff.count_diff,
+            }
+            for diff in differences[:self.top]
+            if diff.size_diff > 0
+        ]
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'pid': self.pid,
+            'stages': self.stages,
+            'peakTracedKB': max((stage['peakTracedKB'] for stage in self.stages), default=0.0),
+            'rssStartKB': self.rss_start_kb,
+            'rssEndKB': _read_status_kb('VmRSS'),
+            # Without a resettable counter this is the process lifetime peak
+            'peakRssKB': _peak_rss_kb(),
+            'peakRssIsPerRequest': self.peak_rss_reset,
+        }
+
+
+@contextmanager
+def memory_stage(name: str):
+    """Record a stage on the active profile, if any; free when profiling is off."""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+
+@contextmanager
+def profiling(enabled: bool, top: int = 5, reset_peak_rss: bool = False):
+    """Activate a MemoryProfile for the enclosed code; yields None when disabled.
+
+    Pass `reset_peak_rss` only where no other request runs in this process.
+    """
+    if not enabled:
+        yield None
+        return
+    _start_tracing()
+    profile = MemoryProfile(top, reset_peak_rss)
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+        _stop_tracing()
+
+
+def run_profiled(func: Callable, args: Sequence[Any], enabled: bool, top: int = 5,
+                 reset_peak_rss: bool = False) -> Tuple[Any, Optional[Dict]]:
+    """Run `func(*args)` (typically on the executor) and return (result, memory report)."""
+    with profiling(enabled, top, reset_peak_rss) as profile:
+        result = func(*args)
+    return result, profile.report() if profile else None
+
+
+class RequestMemoryLog:
+    """Bounded history of per-request memory reports for the metrics endpoint."""
+
+    def __init__(self, size: int = 200):
+        self._lock = threading.Lock()
+        self.requests: Deque[Dict[str, Any]] = deque(maxlen=size)
+
+    def record(self, endpoint: str, view_report: Optional[Dict], worker_report: Optional[Dict],
+               budget_mb: float) -> Dict[str, Any]:
+        stages = (view_report or {}).get('stages', []) + (worker_report or {}).get('stages', [])
+        peak_traced_kb = max((stage['peakTracedKB'] for stage in stages), default=0.0)
+        reports = [report for report in (view_report, worker_report) if report and report.get('peakRssKB')]
+        # Prefer peaks that were reset for this request over process lifetime peaks
+        per_request = [report for report in reports if report['peakRssIsPerRequest']]
+        entry = {
+            'endpoint': endpoint,
+            'timestamp': time.time(),
+            'peakTracedKB': peak_traced_kb,
+            'peakRssKB': max((report['peakRssKB'] for report in per_request or reports), default=None),
+            'peakRssIsPerRequest': bool(per_request),
+            'server': view_report,
+            'worker': worker_report,
+        }
+        with self._lock:
+            self.requests.append(entry)
+
+        if budget_mb and peak_traced_kb > budget_mb * 1024:
+            heaviest = max(stages, key=lambda stage: stage['peakTracedKB'])
+            logger.warning(
+                f"{endpoint} request used {peak_traced_kb / 1024:.1f} MB traced memory "
+                f"(budget {budget_mb} MB, peak RSS {entry['peakRssKB']} KB); heaviest stage "
+                f"{heaviest['stage']}: {heaviest.get('topAllocations', [])}"
+            )
+        return entry
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = list(self.requests)
+        by_endpoint: Dict[str, Dict[str, Any]] = {}
+        for entry in requests:
+            stats = by_endpoint.setdefault(entry['endpoint'], {'requests': 0, 'maxPeakTracedKB': 0.0,
+                                                               'maxPeakRssKB': 0})
+            stats['requests'] += 1
+            stats['maxPeakTracedKB'] = max(stats['maxPeakTracedKB'], entry['peakTracedKB'])
+            stats['maxPeakRssKB'] = max(stats['maxPeakRssKB'], entry['peakRssKB'] or 0)
+        return {'endpoints': by_endpoint, 'requests': requests}
+
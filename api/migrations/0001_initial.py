@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchSummary',
+            fields=[
+                ('match_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('label', models.CharField(blank=True, max_length=255)),
+                ('teams', models.JSONField()),
+                ('summary', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
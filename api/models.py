@@ -1,3 +1,17 @@
 from django.db import models
 
-# Create your models here.
+
+class MatchSummary(models.Model):
+    """Comparison counts of one analyzed match, computed once at analysis time."""
+    match_id = models.CharField(max_length=64, primary_key=True)
+    label = models.CharField(max_length=255, blank=True)
+    teams = models.JSONField()
+    summary = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.label or ' vs '.join(self.teams)
@@ -0,0 +1,89 @@
+import csv
+import random
+from io import StringIO
+from typing import Dict, List, Optional, Sequence
+
+# Same header as the tagging software's export
+COLUMNS = ['Timeline', 'Start time', 'Duration', 'Row', 'Instance number', 'OUTCOME',
+           "PLAYER'S NAME", 'Shot Direction', 'Stroke', 'Ungrouped', 'Notes', 'Flags']
+
+SHOT_TYPES = ['smash', 'clear', 'defend', 'block', 'net', 'lob', 'drop', 'tap', 'H.drive', 'S.drive']
+STROKES = ['Forehand', 'Backhand']
+DIRECTIONS = ['Straight', 'Cross']
+
+DEFAULT_TEAMS = {
+    'TEAM A': ['PLAYER A1', 'PLAYER A2'],
+    'TEAM B': ['PLAYER B1', 'PLAYER B2'],
+}
+
+
+def _set_over(score: Sequence[int]) -> bool:
+    a, b = score
+    return max(a, b) == 30 or (max(a, b) >= 21 and abs(a - b) >= 2)
+
+
+def generate_match_csv(rallies: Optional[int] = None, max_shots: int = 8, seed: int = 0,
+                       teams: Optional[Dict[str, List[str]]] = None,
+                       team1_point_win: float = 0.5, named_outcomes: bool = True) -> str:
+    """Generate a synthetic tagging export.
+
+    Points are simulated under rally-point rules until the match is decided,
+    or for exactly `rallies` rallies when given. Rows are grouped by Row type
+    like the real export, so consumers must sort by start time themselves.
+    `named_outcomes` puts the finishing player on outcome rows, which links
+    players to teams.
+    """
+    rng = random.Random(seed)
+    teams = teams or DEFAULT_TEAMS
+    team_names = list(teams)
+    timeline = f"SYNTHETIC_{seed}_{' - '.join(team_names)}"
+
+    rows = []
+    instances: Dict[str, int] = {}
+
+    def add(start, duration, row, outcome=None, player=None, direction=None, stroke=None):
+        instances[row] = instances.get(row, 0) + 1
+        rows.append([timeline, start, duration, row, instances[row], outcome,
+                     player, direction, stroke, None, None, None])
+
+    score = [0, 0]
+    sets = [0, 0]
+    time = rng.uniform(10, 40)
+    rally = 0
+    while (rallies is None and max(sets) < 2) or (rallies is not None and rally < rallies):
+        rally += 1
+        shots = rng.randint(1, max_shots)
+        duration = round(rng.uniform(1.5, 1.2 * shots + 2), 6)
+        add(time, duration, 'RALLY')
+
+        shot_time = time + duration / (shots + 1)
+        hitter = rng.randrange(2)
+        for index in range(shots):
+            shot_type = 'SERVE' if index == 0 and rng.random() < 0.3 else rng.choice(SHOT_TYPES)
+            add(round(shot_time, 6), 4.0, shot_type,
+                player=rng.choice(teams[team_names[hitter]]),
+                direction=rng.choice(DIRECTIONS), stroke=rng.choice(STROKES))
+            shot_time += duration / (shots + 1)
+            hitter = 1 - hitter
+
+        # The side that hit last either wins the rally outright or errs
+        winner = 0 if rng.random() < team1_point_win else 1
+        last_hitter = 1 - hitter
+        outcome = 'WINNER' if winner == last_hitter else 'ERROR'
+        add(round(time + duration, 6), 4.0, team_names[last_hitter], outcome=outcome,
+            player=rng.choice(teams[team_names[last_hitter]]) if named_outcomes else None)
+
+        score[winner] += 1
+        if _set_over(score):
+            sets[0 if score[0] > score[1] else 1] += 1
+            score = [0, 0]
+        time += duration + rng.uniform(8, 40)
+
+    # Group rows by Row type, as the tagging software does
+    rows.sort(key=lambda r: (r[3] != 'RALLY', r[3] not in team_names, r[3], r[4]))
+
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
@@ -1,3 +1,930 @@
-from django.test import TestCase
+import contextlib
+import csv
+import io
+import os
+import random
+import signal
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import gzip
+
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import NoReverseMatch, reverse
+
+from .comparison import ComparisonError, build_match_summary, compare_summaries
+from .compression import brotli
+from .concurrency import AnalysisUnavailable, admission, get_executor, run_in_executor, shutdown_executor
+from .differential import (
+    EDGE_CASES,
+    REFERENCE,
+    SET_SCORE_VARIANTS,
+    apply_edge_cases,
+    canonical,
+    compare_engines,
+    generate_case,
+    run_engine,
+)
+from .export import (
+    DEFAULT_SET_SCORES, TABLE_COLUMNS, pa, rally_rows, shot_rows, statistics_rows, write_columnar, write_csv,
+)
+from .match_store import MatchStore, match_key, open_match_store
+from .memory import RequestMemoryLog, run_profiled
+from .models import MatchSummary
+from .synthetic import generate_match_csv
+from .utils import ENGINES, MatchDataProcessor, analyze_match_csv, analyze_match_encoded
+from .validation import validate_match_data
+from .views import MemoryMetricsView, UploadFileView
+from .win_probability import (
+    TEAM1_SERVING,
+    TEAM2_SERVING,
+    WinProbabilityTable,
+    estimate_serve_win_probabilities,
+)
+
+# Host served by the test client; ALLOWED_HOSTS has no testserver entry
+HOST = 'badminton-analysis-dy98.onrender.com'
+
+
+def _die():
+    # Stands in for an analysis child killed by the OOM killer
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+# Number of random exports per property; raise it for a deeper run, e.g.
+# DIFFERENTIAL_CASES=500 python manage.py test api
+CASES = int(os.environ.get('DIFFERENTIAL_CASES', 25))
+
+
+class IsolatedStorageMixin:
+    """Give each test its own analysis cache and match store, so the suite never touches the real ones.
+
+    Without it, analyses stored by earlier runs would be served instead of
+    parsing the CSV under test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        cache_dir = os.path.join(directory, 'analysis-cache')
+        self.enterContext(override_settings(
+            ANALYSIS_CACHE_DIR=cache_dir,
+            CACHES={**settings.CACHES, 'analysis': {**settings.CACHES['analysis'], 'LOCATION': cache_dir}},
+            MATCH_STORE_DIR=os.path.join(directory, 'match-store'),
+        ))
+
+
+class EngineEquivalenceTests(SimpleTestCase):
+    """Every engine must return exactly what the frozen reference returns."""
+
+    def assertEquivalent(self, seed, name, content, set_scores):
+        mismatches = compare_engines(content, set_scores)
+        self.assertEqual(mismatches, {}, f"seed={seed} case={name} set_scores={set_scores}")
+
+    def test_random_valid_exports(self):
+        for seed in range(CASES):
+            with self.subTest(seed=seed):
+                self.assertEquivalent(seed, *generate_case(seed, edge_cases=False))
+
+    def test_random_edge_case_exports(self):
+        for seed in range(1000, 1000 + CASES):
+            with self.subTest(seed=seed):
+                self.assertEquivalent(seed, *generate_case(seed))
+
+    def test_each_edge_case(self):
+        for name in EDGE_CASES:
+            for seed in range(3):
+                with self.subTest(edge_case=name, seed=seed):
+                    content = apply_edge_cases(generate_match_csv(seed=seed), [name], random.Random(seed))
+                    for set_scores in ({'set1': {}, 'set2': {}}, {'set1': {}, 'set2': {}, 'set3': {}}):
+                        self.assertEquivalent(seed, name, content, set_scores)
+
+    def test_configured_engine_is_checked_at_startup(self):
+        config = apps.get_app_config('api')
+        for engine in ENGINES:
+            with override_settings(ANALYSIS_ENGINE=engine):
+                config.ready()
+        with override_settings(ANALYSIS_ENGINE='pandas'):
+            with self.assertRaises(ImproperlyConfigured):
+                config.ready()
+
+    def test_divergence_is_reported(self):
+        build = MatchDataProcessor._build_rallies_columnar
+
+        def drop_last_rally(self, sorted_df):
+            return build(self, sorted_df)[:-1]
+
+        content = generate_match_csv(seed=1)
+        with mock.patch.object(MatchDataProcessor, '_build_rallies_columnar', drop_last_rally):
+            mismatches = compare_engines(content, {'set1': {}, 'set2': {}})
+        self.assertEqual(list(mismatches), ['columnar'])
+
+
+class ReferenceQuirkTests(SimpleTestCase):
+    """Pin the reference behaviours the engines are required to reproduce."""
+
+    def analyze(self, content, set_scores=None):
+        outcome = run_engine(REFERENCE, content, set_scores or {'set1': {}, 'set2': {}, 'set3': {}})
+        self.assertIn('result', outcome, outcome.get('error'))
+        return outcome['result']
+
+    def test_serve_only_sequences_are_skipped(self):
+        content = apply_edge_cases(generate_match_csv(seed=4, max_shots=1), ['serve_only_rallies'],
+                                   random.Random(4))
+        result = self.analyze(content)
+        self.assertTrue(any([shot['type'] for shot in rally['shots']] == ['SERVE'] for rally in result['rallies']))
+        sequences = result['statistics']['sequences']
+        for ranked in sequences.values():
+            self.assertNotIn('SERVE', [sequence for sequence, _ in ranked])
+
+    def test_we_ratio_with_zero_errors_is_winner_count(self):
+        content = apply_edge_cases(generate_match_csv(seed=5), ['no_errors'], random.Random(5))
+        players = self.analyze(content)['statistics']['finishingPlayers']
+        self.assertTrue(players)
+        for player in players:
+            self.assertEqual(player['errors'], 0)
+            self.assertEqual(player['weRatio'], player['winners'])
+
+    def test_third_set_requires_set3_score(self):
+        # 120 rallies cannot all fit in two sets
+        content = generate_match_csv(rallies=120, seed=6)
+        with_set3 = self.analyze(content, {'set1': {}, 'set2': {}, 'set3': {}})['statistics']
+        without_set3 = self.analyze(content, {'set1': {}, 'set2': {}})['statistics']
+        self.assertGreater(with_set3['set3Count'], 0)
+        self.assertEqual(without_set3['set3Count'], 0)
+
+    def test_third_team_is_rejected(self):
+        content = apply_edge_cases(generate_match_csv(seed=7), ['third_team'], random.Random(7))
+        for engine in (REFERENCE, *ENGINES):
+            with self.subTest(engine=engine):
+                self.assertIn('Expected exactly 2 teams', run_engine(engine, content, {})['error'])
+
+
+class MemoryProfileTests(SimpleTestCase):
+    """The opt-in memory mode records every analysis stage and stays out of the way when off."""
+
+    def analyze(self, enabled):
+        args = (generate_match_csv(seed=8), {'set1': {}, 'set2': {}, 'set3': {}}, ['statistics'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            return run_profiled(analyze_match_encoded, args, enabled)
+
+    def test_stages_are_recorded(self):
+        encoded, report = self.analyze(True)
+        self.assertIn('identity', encoded['bodies'])
+        self.assertEqual(
+            [stage['stage'] for stage in report['stages']],
+            ['string_io', 'read_csv', 'validate', 'extract_teams_players', 'sort_values',
+             'build_rallies', 'assign_sets', 'statistics', 'summarize', 'encode_response'],
+        )
+        for stage in report['stages']:
+            self.assertGreaterEqual(stage['peakTracedKB'], 0)
+            self.assertIn('topAllocations', stage)
+
+    def test_disabled_profiling_returns_no_report(self):
+        encoded, report = self.analyze(False)
+        self.assertIsNone(report)
+        self.assertIn('identity', encoded['bodies'])
+
+    def test_requests_over_budget_are_logged(self):
+        _, report = self.analyze(True)
+        log = RequestMemoryLog(size=1)
+        with self.assertLogs('api.memory', level='WARNING'):
+            log.record('analyze', None, report, budget_mb=0.001)
+        log.record('analyze', None, report, budget_mb=0)
+        summary = log.summary()
+        self.assertEqual(len(summary['requests']), 1)
+        self.assertEqual(summary['endpoints']['analyze']['maxPeakTracedKB'], report['peakTracedKB'])
+
+    def test_peak_rss_is_reset_only_on_request(self):
+        with mock.patch('api.memory._reset_peak_rss', return_value=True) as reset:
+            _, report = self.analyze(True)
+            reset.assert_not_called()
+            self.assertFalse(report['peakRssIsPerRequest'])
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, report = run_profiled(generate_match_csv, (), True, reset_peak_rss=True)
+            reset.assert_called_once()
+            self.assertTrue(report['peakRssIsPerRequest'])
+
+    def test_per_request_peak_rss_is_preferred(self):
+        server = {'stages': [], 'peakRssKB': 900_000, 'peakRssIsPerRequest': False}
+        worker = {'stages': [], 'peakRssKB': 120_000, 'peakRssIsPerRequest': True}
+        entry = RequestMemoryLog().record('analyze', server, worker, budget_mb=0)
+        self.assertEqual((entry['peakRssKB'], entry['peakRssIsPerRequest']), (120_000, True))
+        entry = RequestMemoryLog().record('analyze', server, None, budget_mb=0)
+        self.assertEqual((entry['peakRssKB'], entry['peakRssIsPerRequest']), (900_000, False))
+
+    def test_metrics_are_not_routed_without_profiling(self):
+        self.assertFalse(settings.ANALYSIS_MEMORY_PROFILING)
+        with self.assertRaises(NoReverseMatch):
+            reverse('memory_metrics')
+
+    def test_metrics_are_staff_only(self):
+        view = MemoryMetricsView.as_view()
+        for is_staff, expected in ((False, 403), (True, 200)):
+            request = RequestFactory().get('/api/metrics/memory/')
+            request.auser = mock.AsyncMock(return_value=mock.Mock(is_staff=is_staff))
+            self.assertEqual(async_to_sync(view)(request).status_code, expected)
+
+
+class MatchComparisonTests(IsolatedStorageMixin, TestCase):
+    """Comparisons are built from stored summaries, aligned across matches."""
+    SET_SCORES = {'set1': {}, 'set2': {}, 'set3': {}}
+
+    def summarize(self, seed, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = analyze_match_csv(generate_match_csv(seed=seed, **kwargs), self.SET_SCORES)
+        return result, build_match_summary(result)
+
+    def test_summary_matches_statistics(self):
+        result, summary = self.summarize(10)
+        statistics = result['statistics']
+        team1 = result['teams'][0]
+        self.assertEqual(summary['weBySet'][team1]['set1'], statistics['setWeAnalysis']['set1'][team1.lower()])
+        for kind, key in (('winning', 'MostWinning'), ('losing', 'MostLosing')):
+            counts = summary['sequences'][team1][kind]
+            for sequence, count in statistics['sequences'][f'{team1.lower()}{key}']:
+                self.assertEqual(counts[sequence], count)
+
+    def test_metrics_are_aligned_with_deltas_to_the_mean(self):
+        matches = [
+            {'matchId': str(seed), 'summary': self.summarize(seed, team1_point_win=win)[1]}
+            for seed, win in ((11, 0.3), (12, 0.7))
+        ]
+        comparison = compare_summaries(matches, team='team a')
+        first, second = comparison['matches']
+        self.assertEqual(first['team'], 'TEAM A')
+        self.assertEqual(first['metrics']['finishing']['shots'].keys(),
+                         second['metrics']['finishing']['shots'].keys())
+        self.assertEqual(first['metrics']['sequenceFrequency']['winning'].keys(),
+                         second['metrics']['sequenceFrequency']['winning'].keys())
+        mean_rate = comparison['mean']['pointsWonRate']
+        self.assertAlmostEqual(first['delta']['pointsWonRate'], first['metrics']['pointsWonRate'] - mean_rate)
+        self.assertAlmostEqual(first['delta']['pointsWonRate'], -second['delta']['pointsWonRate'])
+
+    def test_players_select_the_side_and_their_finishes(self):
+        _, summary = self.summarize(13)
+        comparison = compare_summaries([{'matchId': 'm', 'summary': summary}], players=['player b1'])
+        match = comparison['matches'][0]
+        self.assertEqual(match['team'], 'TEAM B')
+        self.assertEqual(match['metrics']['finishing']['winners'], summary['finishing']['PLAYER B1']['winners'])
+        with self.assertRaises(ComparisonError):
+            compare_summaries([{'matchId': 'm', 'summary': summary}], team='TEAM C')
+
+    def test_compare_endpoint_reads_stored_summaries(self):
+        match_ids = []
+        for seed in (14, 15):
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = self.client.post(
+                    '/api/analyze/',
+                    {'file_data': generate_match_csv(seed=seed), 'set_scores': self.SET_SCORES,
+                     'include': ['statistics'], 'label': f'match {seed}'},
+                    content_type='application/json',
+                    headers={'host': HOST},
+                )
+            self.assertEqual(response.status_code, 200)
+            match_ids.append(response['X-Match-Id'])
+        self.assertEqual(MatchSummary.objects.count(), 2)
+
+        with mock.patch('api.utils.pd.read_csv', side_effect=AssertionError('CSV re-parsed')):
+            response = self.client.get('/api/compare/', {'match': match_ids, 'team': 'TEAM B'},
+                                       headers={'host': HOST})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([match['label'] for match in response.json()['matches']], ['match 14', 'match 15'])
+
+        response = self.client.get('/api/compare/', {'match': ['unknown']},
+                                   headers={'host': HOST})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cache_hit_stores_a_missing_summary(self):
+        def analyze(label):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return self.client.post(
+                    '/api/analyze/',
+                    {'file_data': generate_match_csv(seed=16), 'set_scores': self.SET_SCORES,
+                     'include': ['teams'], 'label': label},
+                    content_type='application/json',
+                    headers={'host': HOST},
+                )
+
+        match_id = analyze('first')['X-Match-Id']
+        MatchSummary.objects.all().delete()
+        with mock.patch('api.views.run_in_executor', side_effect=AssertionError('analyzed again')):
+            self.assertEqual(analyze('second').status_code, 200)
+            self.assertEqual(MatchSummary.objects.get(match_id=match_id).label, 'second')
+            # An existing summary is left alone on later hits
+            analyze('third')
+        self.assertEqual(MatchSummary.objects.get(match_id=match_id).label, 'second')
+
+
+class MatchStoreTests(SimpleTestCase):
+    """Analyses from the shared match store must equal analyses parsed from CSV."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def analyze(self, content, set_scores, store_dir=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return canonical(analyze_match_csv(content, set_scores, store_dir=store_dir))
+
+    def test_stored_analysis_is_identical(self):
+        for seed in range(CASES):
+            name, content, set_scores = generate_case(seed)
+            try:
+                expected = self.analyze(content, set_scores)
+            except Exception:
+                continue  # Invalid exports never reach the store
+            with self.subTest(seed=seed, case=name):
+                self.assertEqual(self.analyze(content, set_scores, self.directory), expected)
+                self.assertIn(match_key(content), open_match_store(self.directory))
+                # Served from the store, with whatever set scores come next
+                for other_scores in SET_SCORE_VARIANTS:
+                    self.assertEqual(self.analyze(content, other_scores, self.directory),
+                                     self.analyze(content, other_scores))
+
+    def test_matches_are_visible_to_other_processes(self):
+        content = generate_match_csv(seed=20)
+        self.analyze(content, {'set1': {}, 'set2': {}}, self.directory)
+        # A separate instance stands in for another worker mapping the same files
+        other = MatchStore(self.directory)
+        stored = other.get(match_key(content))
+        self.assertIsNotNone(stored)
+        self.assertEqual(stored.teams, ['TEAM A', 'TEAM B'])
+        self.assertIsNone(other.get(match_key(generate_match_csv(seed=21))))
+        self.assertEqual(len(other), 1)
+
+    def store(self, store, seed):
+        content = generate_match_csv(seed=seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            processor = MatchDataProcessor(pd.read_csv(io.StringIO(content)))
+            rallies = processor.build_rallies()
+        self.assertTrue(store.put(match_key(content), processor.teams, processor.players, rallies))
+        return match_key(content)
+
+    def test_store_failures_fall_back_to_csv(self):
+        content = generate_match_csv(seed=22)
+        set_scores = {'set1': {}, 'set2': {}}
+        expected = self.analyze(content, set_scores)
+        with self.assertLogs('api.match_store', level='WARNING'):
+            self.assertEqual(self.analyze(content, set_scores, '/dev/null/store'), expected)
+
+        with mock.patch('api.match_store.fcntl.flock', side_effect=OSError('No space left on device')):
+            with self.assertLogs('api.match_store', level='WARNING'):
+                self.assertEqual(self.analyze(content, set_scores, self.directory), expected)
+        self.assertNotIn(match_key(content), MatchStore(self.directory))
+
+        self.analyze(content, set_scores, self.directory)
+        with mock.patch('api.match_store.pa.memory_map', side_effect=OSError('Input/output error')):
+            with self.assertLogs('api.match_store', level='WARNING'):
+                self.assertIsNone(MatchStore(self.directory).get(match_key(content)))
+
+    def test_torn_index_line_is_skipped(self):
+        store = MatchStore(self.directory)
+        first = self.store(store, 23)
+        # A writer died part-way through its index line
+        with open(os.path.join(self.directory, 'index.jsonl'), 'ab') as f:
+            f.write(b'{"match": "torn", "rall')
+        second = self.store(MatchStore(self.directory), 24)
+
+        reader = MatchStore(self.directory)
+        with self.assertLogs('api.match_store', level='WARNING'):
+            self.assertEqual(len(reader), 2)
+        self.assertIsNotNone(reader.get(first))
+        self.assertIsNotNone(reader.get(second))
+        self.assertIsNotNone(store.get(second))
+
+    def test_stores_of_another_version_are_replaced(self):
+        with mock.patch('api.match_store.STORE_VERSION', 0):
+            old = self.store(MatchStore(self.directory), 28)
+            self.assertIsNotNone(MatchStore(self.directory).get(old))
+        # Rallies built by other code are never served, then replaced on the next write
+        reader = MatchStore(self.directory)
+        self.assertIsNone(reader.get(old))
+        self.assertNotIn(old, reader)
+        new = self.store(MatchStore(self.directory), 29)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['.lock', 'index.jsonl', 'rallies.2.arrows', 'shots.2.arrows'])
+        self.assertIsNotNone(reader.get(new))
+        self.assertEqual(len(reader), 1)
+
+    def test_unversioned_store_is_replaced(self):
+        first = self.store(MatchStore(self.directory), 30)
+        # A store written before versioning: no header line, unnumbered files
+        index = os.path.join(self.directory, 'index.jsonl')
+        with open(index, 'rb') as f:
+            entries = f.read().splitlines(keepends=True)[1:]
+        with open(index, 'wb') as f:
+            f.writelines(entries)
+        for table in ('rallies', 'shots'):
+            os.rename(os.path.join(self.directory, f'{table}.1.arrows'),
+                      os.path.join(self.directory, f'{table}.arrows'))
+        self.assertIsNone(MatchStore(self.directory).get(first))
+        self.store(MatchStore(self.directory), 31)
+        self.assertNotIn('rallies.arrows', os.listdir(self.directory))
+
+    def test_full_store_starts_a_new_generation(self):
+        writer = MatchStore(self.directory)
+        first = self.store(writer, 25)
+        reader = MatchStore(self.directory)
+        self.assertIsNotNone(reader.get(first))
+
+        writer.max_bytes = sum(os.path.getsize(os.path.join(self.directory, name))
+                               for name in ('rallies.1.arrows', 'shots.1.arrows')) + 1
+        second = self.store(writer, 26)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['.lock', 'index.jsonl', 'rallies.2.arrows', 'shots.2.arrows'])
+        for store in (writer, reader):
+            self.assertEqual(len(store), 1)
+            self.assertIsNone(store.get(first))
+            self.assertIsNotNone(store.get(second))
+        # Later matches are appended to the new generation
+        self.store(MatchStore(self.directory), 27)
+        self.assertEqual(len(reader), 2)
+
+
+class WinProbabilityTests(SimpleTestCase):
+    """The BWF scoring DP behind the win-probability curves."""
+
+    def setUp(self):
+        self.even = WinProbabilityTable(0.5, 0.5)
+
+    def test_terminal_and_cap_states(self):
+        table = WinProbabilityTable(0.55, 0.45)
+        self.assertEqual(table.game[21, 19, TEAM1_SERVING], 1.0)
+        self.assertEqual(table.game[19, 21, TEAM2_SERVING], 0.0)
+        self.assertEqual(table.game[30, 29, TEAM2_SERVING], 1.0)
+        self.assertEqual(table.game[29, 30, TEAM1_SERVING], 0.0)
+        # 20-20 goes on: a two-point lead or the cap is needed
+        self.assertTrue(0.0 < table.game[21, 20, TEAM1_SERVING] < 1.0)
+        self.assertEqual(table.match_win((2, 0), (0, 0), TEAM1_SERVING), 1.0)
+        self.assertEqual(table.match_win((1, 2), (5, 3), None), 0.0)
+
+    def test_even_teams_are_symmetric(self):
+        self.assertAlmostEqual(self.even.match_win((0, 0), (0, 0), None), 0.5)
+        for sets, score in (((0, 0), (5, 3)), ((1, 0), (18, 20)), ((0, 1), (29, 28))):
+            for server, swapped in ((TEAM1_SERVING, TEAM2_SERVING), (TEAM2_SERVING, TEAM1_SERVING)):
+                self.assertAlmostEqual(
+                    self.even.match_win(sets, score, server),
+                    1 - self.even.match_win(sets[::-1], score[::-1], swapped),
+                )
+
+    def test_29_all_in_the_decider_decides_the_match(self):
+        self.assertAlmostEqual(self.even.point_importance((1, 1), (29, 29)), 1.0)
+        self.assertAlmostEqual(self.even.point_importance((0, 0), (29, 29)), 0.5)
+
+    def test_after_rally_at_set_end(self):
+        table = WinProbabilityTable(0.6, 0.4)
+        self.assertEqual(table.after_rally((1, 1), (21, 19), TEAM1_SERVING), 1.0)
+        self.assertEqual(table.after_rally((1, 1), (28, 30), TEAM2_SERVING), 0.0)
+        # The game winner serves first in the next game
+        self.assertEqual(table.after_rally((0, 0), (21, 15), TEAM1_SERVING),
+                         table.match_win((1, 0), (0, 0), TEAM1_SERVING))
+        self.assertEqual(table.after_rally((0, 0), (10, 12), TEAM2_SERVING),
+                         table.match_win((0, 0), (10, 12), TEAM2_SERVING))
+
+    def test_serve_estimates_start_at_the_prior_and_ignore_later_sets(self):
+        self.assertEqual(estimate_serve_win_probabilities([]), (0.5, 0.5))
+        team1, team2 = estimate_serve_win_probabilities([(TEAM1_SERVING, TEAM1_SERVING)] * 10)
+        self.assertTrue(0.5 < team1 < 0.8)
+        self.assertEqual(team2, 0.5)
+
+        content = generate_match_csv(rallies=90, seed=9, team1_point_win=0.7)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = analyze_match_csv(content, {'set1': {}, 'set2': {}, 'set3': {}})
+        curves = result['statistics']['winProbability']
+        team1_name = result['teams'][0]
+        self.assertEqual(curves['serveWinProbability']['set1'], {name: 0.5 for name in result['teams']})
+        self.assertEqual(curves['set1'][0][f'{team1_name.lower()}WinProbabilityBefore'], 0.5)
+
+
+@override_settings(ANALYSIS_EXECUTOR='process', ANALYSIS_MAX_WORKERS=1)
+class ExecutorRecoveryTests(IsolatedStorageMixin, SimpleTestCase):
+    """A dead pool child must not break every later analysis of the server worker."""
+
+    def setUp(self):
+        super().setUp()
+        shutdown_executor()
+        self.addCleanup(shutdown_executor)
+
+    def run_task(self, func, *args):
+        return async_to_sync(run_in_executor)(func, *args)
+
+    def test_pool_is_replaced_after_a_child_dies(self):
+        self.assertEqual(self.run_task(pow, 2, 3), 8)
+        executor = get_executor()
+        for pid in list(executor._processes):
+            os.kill(pid, signal.SIGKILL)
+        time.sleep(0.5)
+        self.assertEqual(self.run_task(pow, 2, 5), 32)
+        self.assertIsNot(get_executor(), executor)
+
+    def test_task_that_keeps_killing_its_child_is_unavailable(self):
+        with self.assertRaises(AnalysisUnavailable):
+            self.run_task(_die)
+        self.assertEqual(self.run_task(pow, 3, 2), 9)
+
+    def test_views_answer_503(self):
+        unavailable = mock.AsyncMock(side_effect=AnalysisUnavailable('restarting'))
+        with mock.patch('api.views.run_in_executor', unavailable):
+            response = self.client.post(
+                '/api/analyze/',
+                {'file_data': generate_match_csv(seed=30), 'set_scores': {'set1': {}, 'set2': {}}},
+                content_type='application/json',
+                headers={'host': HOST},
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+@override_settings(ANALYSIS_EXECUTOR='thread', ANALYSIS_MAX_IN_FLIGHT=1, ANALYSIS_RETRY_AFTER_SECONDS=7)
+class AdmissionControlTests(IsolatedStorageMixin, TestCase):
+    """Requests over the in-flight or size limits are refused, and slots are always returned."""
+
+    def setUp(self):
+        super().setUp()
+        self.assertEqual(admission.in_flight, 0)
+
+    def analyze(self, file_data='', **extra):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.post(
+                '/api/analyze/',
+                {'file_data': file_data, 'set_scores': {'set1': {}, 'set2': {}}, **extra},
+                content_type='application/json',
+                headers={'host': HOST},
+            )
+
+    def test_requests_over_the_in_flight_limit_get_429(self):
+        self.assertTrue(admission.try_acquire())
+        try:
+            response = self.analyze(generate_match_csv(seed=31))
+        finally:
+            admission.release()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(admission.in_flight, 0)
+
+    @override_settings(ANALYSIS_MAX_UPLOAD_BYTES=100)
+    def test_large_bodies_get_413(self):
+        response = self.analyze('x' * 200)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(admission.in_flight, 0)
+
+    @override_settings(ANALYSIS_MAX_UPLOAD_BYTES=100)
+    def test_large_uploads_without_content_length_get_413(self):
+        upload = io.BytesIO(b'x' * 200)
+        upload.name = 'match.csv'
+        request = RequestFactory().post('/api/upload/', {'file': upload}, headers={'host': HOST})
+        request.FILES  # parse the body, then drop the header like a chunked upload
+        del request.META['CONTENT_LENGTH']
+        response = async_to_sync(UploadFileView.as_view())(request)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(admission.in_flight, 0)
+
+    def test_slot_is_released_after_success_and_errors(self):
+        self.assertEqual(self.analyze(generate_match_csv(seed=32), include=['teams']).status_code, 200)
+        self.assertEqual(admission.in_flight, 0)
+        # Invalid CSV fails validation on the executor
+        self.assertEqual(self.analyze('not,a\nmatch,export\n').status_code, 400)
+        self.assertEqual(admission.in_flight, 0)
+        with mock.patch('api.views.run_in_executor', mock.AsyncMock(side_effect=RuntimeError('boom'))):
+            self.assertEqual(self.analyze(generate_match_csv(seed=33)).status_code, 400)
+        self.assertEqual(admission.in_flight, 0)
+        # A limit of one still admits the next request once the slot is back
+        self.assertEqual(self.analyze(generate_match_csv(seed=32), include=['teams']).status_code, 200)
+
+    def test_options_requests_are_not_counted(self):
+        self.assertTrue(admission.try_acquire())
+        try:
+            response = self.client.options('/api/analyze/', headers={'host': HOST})
+        finally:
+            admission.release()
+        self.assertNotEqual(response.status_code, 429)
+
+
+@override_settings(ANALYSIS_EXECUTOR='thread')
+class CompressionNegotiationTests(IsolatedStorageMixin, TestCase):
+    """Precompressed analysis bodies, per-coding ETags and conditional GETs."""
+
+    def setUp(self):
+        super().setUp()
+        self.file_data = generate_match_csv(seed=40)
+
+    def analyze(self, **headers):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.post(
+                '/api/analyze/',
+                {'file_data': self.file_data, 'set_scores': {'set1': {}, 'set2': {}}},
+                content_type='application/json',
+                headers={'host': HOST, **headers},
+            )
+
+    def test_accept_encoding_selects_the_body(self):
+        identity = self.analyze()
+        self.assertEqual(identity.status_code, 200)
+        self.assertNotIn('Content-Encoding', identity)
+        self.assertIn('Accept-Encoding', identity['Vary'])
+
+        compressed = self.analyze(accept_encoding='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), identity.content)
+        self.assertEqual(compressed['ETag'], identity['ETag'][:-1] + '-gzip"')
+
+        refused = self.analyze(accept_encoding='gzip;q=0, identity')
+        self.assertNotIn('Content-Encoding', refused)
+        self.assertEqual(refused['ETag'], identity['ETag'])
+
+    @unittest.skipIf(brotli is None, "brotli is not installed")
+    def test_brotli_is_preferred_when_accepted(self):
+        response = self.analyze(accept_encoding='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.analyze().content)
+
+    def test_conditional_get_of_the_content_location(self):
+        posted = self.analyze(accept_encoding='gzip')
+        location = posted['Content-Location']
+
+        fresh = self.client.get(location, headers={'host': HOST, 'accept_encoding': 'gzip',
+                                                   'if_none_match': posted['ETag']})
+        self.assertEqual(fresh.status_code, 304)
+        self.assertEqual(fresh['ETag'], posted['ETag'])
+
+        # The gzip validator does not match the identity representation
+        other = self.client.get(location, headers={'host': HOST, 'if_none_match': posted['ETag']})
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other['ETag'], posted['ETag'])
+
+        missing = self.client.get('/api/analyze/unknown/', headers={'host': HOST})
+        self.assertEqual(missing.status_code, 404)
+
+    def test_each_coding_is_cached_on_its_own(self):
+        location = self.analyze()['Content-Location']
+        key = location.rstrip('/').rsplit('/', 1)[-1]
+        self.assertEqual(caches['analysis'].get(key)['codings'][:2], ['identity', 'gzip'])
+        caches['analysis'].delete(f'{key}:gzip')
+        # Only the body being served is read, so the identity one is still found
+        self.assertEqual(self.client.get(location, headers={'host': HOST}).status_code, 200)
+        self.assertEqual(self.client.get(location, headers={'host': HOST, 'accept_encoding': 'gzip'}).status_code,
+                         404)
+
+    def test_results_are_visible_to_other_workers(self):
+        location = self.analyze()['Content-Location']
+        key = location.rstrip('/').rsplit('/', 1)[-1]
+        # A separate backend instance stands in for another gunicorn worker
+        other_worker = FileBasedCache(settings.ANALYSIS_CACHE_DIR, {})
+        self.assertIsNotNone(other_worker.get(key))
+
+
+class ValidationTests(SimpleTestCase):
+    """Every quality-report code, with the CSV line numbers it reports."""
+
+    def setUp(self):
+        self.df = pd.read_csv(io.StringIO(generate_match_csv(rallies=12, seed=50)))
+        self.rallies = self.df.index[self.df['Row'].eq('RALLY')]
+        self.outcomes = self.df.index[self.df['OUTCOME'].isin(['WINNER', 'ERROR'])]
+        self.shots = self.df.index.difference(self.rallies).difference(self.outcomes)
+
+    def report(self, df=None):
+        return validate_match_data(self.df if df is None else df)
+
+    def issue(self, report, code, kind='warnings'):
+        issues = {issue['code']: issue for issue in report[kind]}
+        self.assertIn(code, issues, report)
+        return issues[code]
+
+    def line(self, label):
+        # Line 1 is the header
+        return int(label) + 2
+
+    def rally_of(self, label):
+        """The RALLY row a row is grouped under (latest rally starting at or before it)."""
+        rallies = self.df.loc[self.rallies].sort_values('Start time')
+        return rallies.index[rallies['Start time'] <= self.df.loc[label, 'Start time']][-1]
+
+    def test_clean_export(self):
+        report = self.report()
+        self.assertTrue(report['valid'])
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(report['teams'], ['TEAM A', 'TEAM B'])
+        self.assertEqual(report['rows'], len(self.df))
+
+    def test_missing_columns(self):
+        report = self.report(self.df.drop(columns=['OUTCOME']))
+        self.assertFalse(report['valid'])
+        self.assertEqual(self.issue(report, 'missing_columns', 'errors')['columns'], ['OUTCOME'])
+        self.assertEqual(report['teams'], [])
+
+    def test_no_rallies(self):
+        self.df.loc[self.rallies, 'Row'] = 'POINT'
+        self.issue(self.report(), 'no_rallies', 'errors')
+
+    def test_start_time_is_required_for_rallies_and_outcomes_only(self):
+        self.df.loc[self.rallies[3], 'Start time'] = None
+        report = self.report()
+        self.assertEqual(self.issue(report, 'invalid_start_time', 'errors')['rows'], [self.line(self.rallies[3])])
+
+        self.df = pd.read_csv(io.StringIO(generate_match_csv(rallies=12, seed=50)))
+        note = len(self.df)
+        self.df.loc[note] = {'Row': 'Notes', 'Notes': 'a note'}
+        report = self.report()
+        self.assertTrue(report['valid'], report['errors'])
+        self.assertEqual(self.issue(report, 'row_without_start_time')['rows'], [self.line(note)])
+
+    def test_non_numeric_start_time_is_an_error_on_any_row(self):
+        self.df['Start time'] = self.df['Start time'].astype(object)
+        self.df.loc[self.shots[4], 'Start time'] = 'abc'
+        report = self.report()
+        self.assertFalse(report['valid'])
+        self.assertEqual(self.issue(report, 'invalid_start_time', 'errors')['rows'], [self.line(self.shots[4])])
+        self.assertNotIn('row_without_start_time', [issue['code'] for issue in report['warnings']])
+
+    def test_invalid_duration(self):
+        self.df.loc[self.rallies[2], 'Duration'] = -1
+        issue = self.issue(self.report(), 'invalid_duration', 'errors')
+        self.assertEqual(issue['rows'], [self.line(self.rallies[2])])
+        self.assertEqual(issue['count'], 1)
+
+    def test_team_count(self):
+        # The rows of the least used team are the ones reported
+        self.df.loc[self.outcomes[0], 'Row'] = 'TEAM C'
+        report = self.report()
+        issue = self.issue(report, 'team_count', 'errors')
+        self.assertEqual(issue['teams']['TEAM C'], 1)
+        self.assertEqual(issue['rows'], [self.line(self.outcomes[0])])
+        self.assertEqual(report['teams'], [])
+
+    def test_invalid_outcome(self):
+        self.df.loc[self.outcomes[4], 'OUTCOME'] = 'LET'
+        self.assertEqual(self.issue(self.report(), 'invalid_outcome', 'errors')['rows'],
+                         [self.line(self.outcomes[4])])
+
+    def test_rows_before_first_rally(self):
+        first = self.df.loc[self.rallies, 'Start time'].min()
+        self.df.loc[self.shots[0], 'Start time'] = first - 5
+        self.assertEqual(self.issue(self.report(), 'rows_before_first_rally')['rows'], [self.line(self.shots[0])])
+
+    def test_shot_without_player(self):
+        self.df.loc[self.shots[5], "PLAYER'S NAME"] = None
+        self.assertEqual(self.issue(self.report(), 'shot_without_player')['rows'], [self.line(self.shots[5])])
+
+    def test_rally_outcome_counts(self):
+        dropped = self.outcomes[1]
+        rally = self.rally_of(dropped)
+        report = self.report(self.df.drop(index=dropped))
+        self.assertEqual(self.issue(report, 'rally_without_outcome')['rows'], [self.line(rally)])
+
+        extra = self.df.loc[[self.outcomes[6]]].assign(**{'Start time': self.df.loc[self.outcomes[6], 'Start time'] + 0.001})
+        self.df = pd.concat([self.df, extra], ignore_index=True)
+        self.assertEqual(self.issue(self.report(), 'rally_with_several_outcomes')['rows'],
+                         [self.line(self.rally_of(self.outcomes[6]))])
+
+    def test_overlapping_rallies(self):
+        ordered = self.df.loc[self.rallies].sort_values('Start time').index
+        self.df.loc[ordered[0], 'Duration'] = 10_000
+        issue = self.issue(self.report(), 'overlapping_rallies')
+        self.assertEqual(issue['rows'], [self.line(ordered[1])])
+
+    def test_unknown_players(self):
+        self.df.loc[self.shots[2], "PLAYER'S NAME"] = 'SUBSTITUTE'
+        issue = self.issue(self.report(), 'unknown_players')
+        self.assertIn('SUBSTITUTE', issue['players'])
+        self.assertIn(self.line(self.shots[2]), issue['rows'])
+        self.assertNotIn('PLAYER A2', issue['players'])  # Named on outcome rows
+
+
+class ExportTests(IsolatedStorageMixin, TestCase):
+    """Exported tables carry every rally, shot and statistic of the analysis, in every format."""
+
+    MATCHES = [(f'match-{seed}', generate_match_csv(seed=seed), DEFAULT_SET_SCORES) for seed in (60, 61)]
+
+    def setUp(self):
+        super().setUp()
+        self.assertEqual(admission.in_flight, 0)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def expected(self, table):
+        builder = {'rallies': rally_rows, 'shots': shot_rows, 'statistics': statistics_rows}[table]
+        return [row for match_id, content, set_scores in self.MATCHES
+                for row in builder(match_id, analyze_match_csv(content, set_scores))]
+
+    def read_csv(self, text, table):
+        types = dict(TABLE_COLUMNS[table])
+        convert = {'int64': int, 'float64': float, 'string': str}
+        return [
+            {name: convert[types[name]](value) if value != '' else None for name, value in row.items()}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+
+    def test_row_builders(self):
+        match_id, content, set_scores = self.MATCHES[0]
+        analysis = analyze_match_csv(content, set_scores)
+        rallies = rally_rows(match_id, analysis)
+        shots = shot_rows(match_id, analysis)
+        statistics = statistics_rows(match_id, analysis)
+
+        for rows, table in ((rallies, 'rallies'), (shots, 'shots'), (statistics, 'statistics')):
+            self.assertTrue(all(list(row) == [name for name, _ in TABLE_COLUMNS[table]] for row in rows))
+        self.assertEqual([row['rally_number'] for row in rallies], [rally['number'] for rally in analysis['rallies']])
+        self.assertEqual(sum(row['shot_count'] for row in rallies), len(shots))
+        self.assertEqual([(row['type'], row['player'], row['time']) for row in shots],
+                         [(shot['type'], shot['player'], shot['time'])
+                          for rally in analysis['rallies'] for shot in rally['shots']])
+        metrics = {(row['scope'], row['team'], row['player'], row['metric']): row['value'] for row in statistics}
+        self.assertEqual(metrics[('match', None, None, 'totalRallies')], analysis['statistics']['totalRallies'])
+        for team in analysis['teams']:
+            self.assertEqual(metrics[('match', team, None, 'points')], analysis['statistics'][f'{team}Points'])
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_columnar_writers_round_trip(self):
+        import pyarrow.parquet as pq
+
+        for fmt, read in (('parquet', pq.read_table), ('arrow', lambda path: pa.ipc.open_file(path).read_all())):
+            paths = {table: os.path.join(self.directory.name, f'{table}.{fmt}') for table in TABLE_COLUMNS}
+            write_columnar(self.MATCHES, paths, fmt)
+            for table, path in paths.items():
+                with self.subTest(fmt=fmt, table=table):
+                    self.assertEqual(read(path).to_pylist(), self.expected(table))
+
+    def test_csv_writer_round_trip(self):
+        paths = {table: os.path.join(self.directory.name, f'{table}.csv') for table in TABLE_COLUMNS}
+        write_csv(self.MATCHES, paths)
+        for table, path in paths.items():
+            with open(path, newline='', encoding='utf-8') as f:
+                self.assertEqual(self.read_csv(f.read(), table), self.expected(table), table)
+
+    def test_export_matches_command(self):
+        files = []
+        for match_id, content, _ in self.MATCHES:
+            files.append(os.path.join(self.directory.name, f'{match_id}.csv'))
+            with open(files[-1], 'w', encoding='utf-8') as f:
+                f.write(content)
+        output_dir = os.path.join(self.directory.name, 'out')
+
+        call_command('export_matches', *files, format='csv', output_dir=output_dir,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        for table in TABLE_COLUMNS:
+            with open(os.path.join(output_dir, f'{table}.csv'), newline='', encoding='utf-8') as f:
+                self.assertEqual(self.read_csv(f.read(), table), self.expected(table), table)
+
+        with open(files[1], 'w', encoding='utf-8') as f:
+            f.write('not,a\nmatch,export\n')
+        with self.assertRaises(CommandError):
+            call_command('export_matches', *files, format='csv', output_dir=output_dir,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+
+    def export(self, matches, table='rallies', fmt='csv'):
+        return self.client.post(
+            '/api/export/',
+            {'matches': [{'match_id': match_id, 'file_data': content} for match_id, content, _ in matches],
+             'table': table, 'format': fmt},
+            content_type='application/json',
+            headers={'host': HOST},
+        )
+
+    def read_stream(self, response) -> str:
+        """Drain a streamed body the way the ASGI server does, closing the response at the end."""
+        async def read():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(read)().decode('utf-8')
+
+    def test_streamed_csv_export(self):
+        response = self.export(self.MATCHES, 'shots')
+        self.assertEqual(response.status_code, 200)
+        # The analyses run while the body is streamed, so the slot is still taken
+        self.assertEqual(admission.in_flight, 1)
+        body = self.read_stream(response)
+        self.assertEqual(self.read_csv(body, 'shots'), self.expected('shots'))
+        self.assertEqual(admission.in_flight, 0)
+
+    def test_abandoned_stream_releases_its_slot(self):
+        response = self.export(self.MATCHES)
+        self.assertEqual(admission.in_flight, 1)
+        response.close()
+        self.assertEqual(admission.in_flight, 0)
+
+    def test_failure_while_streaming_aborts_the_response(self):
+        response = self.export(self.MATCHES)
+        with mock.patch('api.views.run_in_executor', mock.AsyncMock(side_effect=RuntimeError('boom'))):
+            with self.assertRaises(RuntimeError):
+                self.read_stream(response)
+        self.assertEqual(admission.in_flight, 0)
+
+    def test_bad_match_is_rejected_before_streaming(self):
+        response = self.export(self.MATCHES + [('broken', 'not,a\nmatch,export\n', DEFAULT_SET_SCORES)])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Match broken', response.json()['error'])
+        self.assertFalse(response.json()['qualityReport']['valid'])
+        self.assertEqual(admission.in_flight, 0)
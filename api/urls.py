@@ -1,9 +1,26 @@
 # api/urls.py
 
+from django.conf import settings
 from django.urls import path
-from .views import UploadFileView, AnalyzeMatchView
+from .views import (
+    UploadFileView,
+    AnalyzeMatchView,
+    AnalysisResultView,
+    CompareMatchesView,
+    ExportView,
+    MatchSummaryListView,
+    MemoryMetricsView,
+)
 
 urlpatterns = [
     path('upload/', UploadFileView.as_view(), name='upload_file'),
     path('analyze/', AnalyzeMatchView.as_view(), name='analyze_match'),
+    path('analyze/<str:key>/', AnalysisResultView.as_view(), name='analysis_result'),
+    path('export/', ExportView.as_view(), name='export_matches'),
+    path('matches/', MatchSummaryListView.as_view(), name='match_summaries'),
+    path('compare/', CompareMatchesView.as_view(), name='compare_matches'),
 ]
+
+# Process ids and source paths of allocation sites are internal details
+if settings.ANALYSIS_MEMORY_PROFILING:
+    urlpatterns.append(path('metrics/memory/', MemoryMetricsView.as_view(), name='memory_metrics'))
@@ -1,29 +1,61 @@
 import pandas as pd
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 import json
 import traceback
+from io import StringIO
+from .comparison import build_match_summary
+from .compression import ANALYSIS_SECTIONS, encode_result
+from .match_store import DEFAULT_MAX_BYTES, match_key, open_match_store
+from .memory import memory_stage
+from .validation import MatchDataError, validate_match_data
+from .win_probability import (
+    TEAM1_SERVING,
+    TEAM2_SERVING,
+    estimate_serve_win_probabilities,
+    get_win_probability_table,
+)
+
+# Rally-building engines; every engine must match api/reference.py exactly
+ENGINES = ('iterrows', 'columnar')
+DEFAULT_ENGINE = 'iterrows'
+
 
 class MatchDataProcessor:
+    RALLY_BUILDERS = {
+        'iterrows': '_build_rallies_iterrows',
+        'columnar': '_build_rallies_columnar',
+    }
+
     def __init__(self, csv_file):
         try:
-            # Try to read the CSV file
-            self.df = pd.read_csv(csv_file)
+            # Accept an already parsed (and validated) DataFrame or read the CSV file
+            self.df = csv_file if isinstance(csv_file, pd.DataFrame) else pd.read_csv(csv_file)
             
             # Debug print
             print("CSV columns:", self.df.columns.tolist())
             print("First few rows:", self.df.head())
             
             # Extract teams and players
-            self.teams = self._extract_teams()
-            print("Extracted teams:", self.teams)
-            
-            self.players = self._extract_players()
-            print("Extracted players:", self.players)
+            with memory_stage('extract_teams_players'):
+                self.teams = self._extract_teams()
+                print("Extracted teams:", self.teams)
+
+                self.players = self._extract_players()
+                print("Extracted players:", self.players)
             
         except Exception as e:
             print(f"Error initializing MatchDataProcessor: {str(e)}")
             raise
 
+    @classmethod
+    def from_parsed(cls, teams: List[str], players: Dict[str, List[str]]) -> 'MatchDataProcessor':
+        """Processor for rallies that were already built, e.g. read from the match store."""
+        processor = cls.__new__(cls)
+        processor.df = None
+        processor.teams = teams
+        processor.players = players
+        return processor
+
     def _extract_teams(self) -> List[str]:
         """Extract unique team names from the CSV."""
         try:
@@ -70,73 +102,137 @@ class MatchDataProcessor:
             print(traceback.format_exc())
             raise
     
-    def process_match_data(self, set_scores: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
-        """Process match data with provided set scores."""
+    def process_match_data(self, set_scores: Dict[str, Dict[str, int]], engine: str = DEFAULT_ENGINE) -> Dict[str, Any]:
+        """Process match data with provided set scores using the given rally-building engine."""
         try:
             print("Processing match data with scores:", set_scores)
             
-            # Initialize empty rallies list
-            rallies = []
-            current_rally = None
-            
-            # Sort dataframe by start time
-            sorted_df = self.df.sort_values(by=["Start time"])
-            
-            # Process each row
-            for _, row in sorted_df.iterrows():
-                if row["Row"] == "RALLY":
-                    if current_rally:
-                        rallies.append(current_rally)
-                    current_rally = {
-                        "number": row["Instance number"],
-                        "startTime": row["Start time"],
-                        "duration": row["Duration"],
-                        "shots": [],
-                        "outcome": None,
-                        "set": None  # Will be assigned later
-                    }
-                elif current_rally:
-                    if row["Row"] in self.teams:
-                        # Process outcome
-                        point_winner = self._determine_point_winner(row)
-                        current_rally["outcome"] = {
-                            "pointWinner": point_winner,
-                            "outcomeTeam": row["Row"],
-                            "type": row["OUTCOME"],
-                            "time": row["Start time"]
-                        }
-                    elif pd.notna(row["PLAYER'S NAME"]):
-                        # Process shot
-                        current_rally["shots"].append({
-                            "type": row["Row"] if pd.notna(row["Row"]) else None,
-                            "player": row["PLAYER'S NAME"] if pd.notna(row["PLAYER'S NAME"]) else None,
-                            "stroke": row["Stroke"] if pd.notna(row["Stroke"]) else None,
-                            "direction": row["Shot Direction"] if pd.notna(row["Shot Direction"]) else None,
-                            "time": float(row["Start time"]) if pd.notna(row["Start time"]) else None
-                        })
-            
-            # Add the last rally if exists
-            if current_rally:
-                rallies.append(current_rally)
-            
-            # Assign sets and scores to rallies
-            self._assign_sets_to_rallies(rallies, set_scores)
-            
-            # Generate statistics
-            statistics = self._generate_statistics(rallies)
-            
-            return {
-                "teams": self.teams,
-                "players": self.players,
-                "rallies": rallies,
-                "statistics": statistics
-            }
+            rallies = self.build_rallies(engine)
+            return self.analyze_rallies(rallies, set_scores)
             
         except Exception as e:
             print(f"Error processing match data: {str(e)}")
             print(traceback.format_exc())
             raise
+
+    def build_rallies(self, engine: str = DEFAULT_ENGINE) -> List[Dict]:
+        """Sort rows by start time and group them into rallies (no sets assigned yet)."""
+        with memory_stage('sort_values'):
+            sorted_df = self.df.sort_values(by=["Start time"])
+        with memory_stage('build_rallies'):
+            return getattr(self, self.RALLY_BUILDERS[engine])(sorted_df)
+
+    def analyze_rallies(self, rallies: List[Dict], set_scores: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+        """Assign sets and scores to built rallies and generate the statistics."""
+        with memory_stage('assign_sets'):
+            self._assign_sets_to_rallies(rallies, set_scores)
+
+        with memory_stage('statistics'):
+            statistics = self._generate_statistics(rallies)
+
+        return {
+            "teams": self.teams,
+            "players": self.players,
+            "rallies": rallies,
+            "statistics": statistics
+        }
     
+    def _build_rallies_iterrows(self, sorted_df: pd.DataFrame) -> List[Dict]:
+        """Group time-sorted rows into rallies, one pandas row at a time."""
+        rallies = []
+        current_rally = None
+
+        # Process each row
+        for _, row in sorted_df.iterrows():
+            if row["Row"] == "RALLY":
+                if current_rally:
+                    rallies.append(current_rally)
+                current_rally = {
+                    "number": row["Instance number"],
+                    "startTime": row["Start time"],
+                    "duration": row["Duration"],
+                    "shots": [],
+                    "outcome": None,
+                    "set": None  # Will be assigned later
+                }
+            elif current_rally:
+                if row["Row"] in self.teams:
+                    # Process outcome
+                    point_winner = self._determine_point_winner(row)
+                    current_rally["outcome"] = {
+                        "pointWinner": point_winner,
+                        "outcomeTeam": row["Row"],
+                        "type": row["OUTCOME"],
+                        "time": row["Start time"]
+                    }
+                elif pd.notna(row["PLAYER'S NAME"]):
+                    # Process shot
+                    current_rally["shots"].append({
+                        "type": row["Row"] if pd.notna(row["Row"]) else None,
+                        "player": row["PLAYER'S NAME"] if pd.notna(row["PLAYER'S NAME"]) else None,
+                        "stroke": row["Stroke"] if pd.notna(row["Stroke"]) else None,
+                        "direction": row["Shot Direction"] if pd.notna(row["Shot Direction"]) else None,
+                        "time": float(row["Start time"]) if pd.notna(row["Start time"]) else None
+                    })
+
+        # Add the last rally if exists
+        if current_rally:
+            rallies.append(current_rally)
+
+        return rallies
+
+    def _build_rallies_columnar(self, sorted_df: pd.DataFrame) -> List[Dict]:
+        """Group time-sorted rows into rallies from plain column arrays.
+
+        Same output as _build_rallies_iterrows (checked by api/differential.py)
+        without building a pandas Series per row.
+        """
+        columns = ["Row", "Instance number", "Start time", "Duration", "OUTCOME",
+                   "PLAYER'S NAME", "Stroke", "Shot Direction"]
+        values = [sorted_df[column].to_numpy(dtype=object) for column in columns]
+        missing = [pd.isna(column) for column in values]
+        teams = set(self.teams)
+        team1, team2 = self.teams
+
+        rallies = []
+        current_rally = None
+        for i, (row_type, number, start, duration, outcome, player, stroke, direction) in enumerate(zip(*values)):
+            if row_type == "RALLY":
+                if current_rally:
+                    rallies.append(current_rally)
+                current_rally = {
+                    "number": number,
+                    "startTime": start,
+                    "duration": duration,
+                    "shots": [],
+                    "outcome": None,
+                    "set": None  # Will be assigned later
+                }
+            elif current_rally:
+                if not missing[0][i] and row_type in teams:
+                    if row_type == team1:
+                        point_winner = team1 if outcome == "WINNER" else team2
+                    else:
+                        point_winner = team2 if outcome == "WINNER" else team1
+                    current_rally["outcome"] = {
+                        "pointWinner": point_winner,
+                        "outcomeTeam": row_type,
+                        "type": outcome,
+                        "time": start
+                    }
+                elif not missing[5][i]:
+                    current_rally["shots"].append({
+                        "type": None if missing[0][i] else row_type,
+                        "player": player,
+                        "stroke": None if missing[6][i] else stroke,
+                        "direction": None if missing[7][i] else direction,
+                        "time": None if missing[2][i] else float(start)
+                    })
+
+        if current_rally:
+            rallies.append(current_rally)
+        return rallies
+
     def _determine_point_winner(self, row) -> str:
         """Determine point winner based on outcome."""
         if row["Row"] == self.teams[0]:
@@ -372,6 +468,7 @@ class MatchDataProcessor:
             'finishingPlayers': finishing_players_list,
             'rallyLengthByOutcome': rally_length_outcomes,
             'momentum': momentum,
+            'winProbability': self._generate_win_probability_data(rallies),
             'setWeAnalysis': set_we_analysis
         }
 
@@ -401,6 +498,67 @@ class MatchDataProcessor:
         
         return momentum_data
 
+    def _generate_win_probability_data(self, rallies: List[Dict]) -> Dict[str, Any]:
+        """Generate per-rally match win probability and point importance curves."""
+        team1, team2 = self.teams
+
+        # Replay the match to recover the pre-rally state of every point
+        states = []
+        sets_won = [0, 0]
+        score = [0, 0]
+        current_set = None
+        server = None  # Unknown until the first rally has been played
+        for rally in rallies:
+            if not (rally['outcome'] and rally['outcome']['pointWinner'] and rally.get('set')):
+                continue
+            if current_set is not None and rally['set'] != current_set:
+                if score[0] != score[1]:
+                    sets_won[0 if score[0] > score[1] else 1] += 1
+                score = [0, 0]
+            current_set = rally['set']
+
+            winner = TEAM1_SERVING if rally['outcome']['pointWinner'] == team1 else TEAM2_SERVING
+            states.append((rally, tuple(sets_won), tuple(score), server, winner))
+            score[winner] += 1
+            server = winner
+
+        # Each set only uses the rallies of earlier sets, so the curve never
+        # knows about points that are still to be played
+        serve_win = {}
+        for set_number in (1, 2, 3):
+            serve_win[f'set{set_number}'] = estimate_serve_win_probabilities(
+                (state[3], state[4]) for state in states if state[0]['set'] < set_number
+            )
+
+        win_probability = {
+            'serveWinProbability': {
+                set_key: {team1: team1_serve_win, team2: team2_serve_win}
+                for set_key, (team1_serve_win, team2_serve_win) in serve_win.items()
+            },
+            'set1': [],
+            'set2': [],
+            'set3': []
+        }
+        for rally, sets, (team1_score, team2_score), server, winner in states:
+            set_key = f"set{rally['set']}"
+            if set_key not in win_probability:
+                continue
+            table = get_win_probability_table(*serve_win[set_key])
+            score_after = (team1_score + (winner == TEAM1_SERVING), team2_score + (winner == TEAM2_SERVING))
+            probability_after = table.after_rally(sets, score_after, winner)
+            win_probability[set_key].append({
+                'rally': len(win_probability[set_key]) + 1,
+                'number': rally['number'],
+                'score': f"{score_after[0]}-{score_after[1]}",
+                f'{team1.lower()}WinProbability': round(probability_after, 4),
+                f'{team2.lower()}WinProbability': round(1 - probability_after, 4),
+                f'{team1.lower()}WinProbabilityBefore': round(table.match_win(sets, (team1_score, team2_score), server), 4),
+                'importance': round(table.point_importance(sets, (team1_score, team2_score)), 4),
+                'pointWinner': rally['outcome']['pointWinner']
+            })
+
+        return win_probability
+
     def analyze_match(self, set_scores: Dict) -> Dict:
         """Analyze match data and return structured analysis."""
         # Process the match data first to populate rallies
@@ -429,3 +587,78 @@ class MatchDataProcessor:
                 })
         
         return timeline
+
+
+def load_validated_csv(content: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Parse CSV content once and validate it, raising MatchDataError on errors."""
+    with memory_stage('string_io'):
+        buffer = StringIO(content)
+    with memory_stage('read_csv'):
+        df = pd.read_csv(buffer)
+    with memory_stage('validate'):
+        report = validate_match_data(df)
+    if not report['valid']:
+        raise MatchDataError(
+            f"Match data failed validation with {len(report['errors'])} error(s)", report
+        )
+    return df, report
+
+
+def ingest_csv(content: str) -> Dict[str, Any]:
+    """Validate uploaded CSV content and return its teams and quality report."""
+    df, report = load_validated_csv(content)
+    processor = MatchDataProcessor(df)
+    return {'teams': processor.teams, 'qualityReport': report}
+
+
+def analyze_match_csv(content: str, set_scores: Dict[str, Dict[str, int]],
+                      engine: str = DEFAULT_ENGINE, store_dir: Optional[str] = None,
+                      store_max_bytes: int = DEFAULT_MAX_BYTES) -> Dict[str, Any]:
+    """Parse and validate CSV content, then run the full match analysis.
+
+    With `store_dir`, the built rallies come from (or are added to) the shared
+    match store there, so each match is parsed once per host.
+    """
+    store = open_match_store(store_dir, store_max_bytes)
+    if store is None:
+        df, _ = load_validated_csv(content)
+        processor = MatchDataProcessor(df)
+        return processor.process_match_data(set_scores, engine=engine)
+
+    key = match_key(content)
+    with memory_stage('match_store'):
+        stored = store.get(key)
+    if stored is None:
+        df, _ = load_validated_csv(content)
+        processor = MatchDataProcessor(df)
+        rallies = processor.build_rallies(engine)
+        # Stored before sets are assigned, so any set scores can reuse them
+        store.put(key, processor.teams, processor.players, rallies)
+    else:
+        processor = MatchDataProcessor.from_parsed(stored.teams, stored.players)
+        rallies = stored.rallies
+    return processor.analyze_rallies(rallies, set_scores)
+
+
+def analyze_match_encoded(content: str, set_scores: Dict[str, Dict[str, int]],
+                          include: List[str], engine: str = DEFAULT_ENGINE,
+                          store_dir: Optional[str] = None,
+                          store_max_bytes: int = DEFAULT_MAX_BYTES) -> Dict[str, Any]:
+    """Run the analysis and return it pre-rendered and pre-compressed."""
+    encoded, _ = analyze_match_summarized(content, set_scores, include, engine=engine, store_dir=store_dir,
+                                          store_max_bytes=store_max_bytes)
+    return encoded
+
+
+def analyze_match_summarized(content: str, set_scores: Dict[str, Dict[str, int]], include: List[str],
+                             engine: str = DEFAULT_ENGINE,
+                             store_dir: Optional[str] = None,
+                             store_max_bytes: int = DEFAULT_MAX_BYTES) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Run the analysis once, returning it pre-rendered plus its comparison summary."""
+    result = analyze_match_csv(content, set_scores, engine=engine, store_dir=store_dir,
+                               store_max_bytes=store_max_bytes)
+    with memory_stage('summarize'):
+        summary = build_match_summary(result)
+    with memory_stage('encode_response'):
+        encoded = encode_result({section: result[section] for section in ANALYSIS_SECTIONS if section in include})
+    return encoded, summary
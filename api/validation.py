@@ -0,0 +1,158 @@
+import pandas as pd
+import numpy as np
+from typing import Any, Dict, List
+
+REQUIRED_COLUMNS = ['Start time', 'Duration', 'Row', 'Instance number', 'OUTCOME', "PLAYER'S NAME"]
+OUTCOME_TYPES = ['WINNER', 'ERROR']
+
+# Long lists of offending rows are truncated in the report
+MAX_REPORTED_ROWS = 50
+
+# Row numbers in the report are 1-based CSV line numbers (line 1 is the header)
+HEADER_LINES = 1
+
+
+class MatchDataError(ValueError):
+    """Raised when uploaded match data fails validation; carries the quality report."""
+
+    def __init__(self, message: str, report: Dict[str, Any]):
+        super().__init__(message, report)
+        self.message = message
+        self.report = report
+
+    def __str__(self):
+        return self.message
+
+
+def _issue(code: str, message: str, index: pd.Index = None, **details) -> Dict[str, Any]:
+    """Build one report entry, converting DataFrame index labels to CSV line numbers."""
+    issue = {'code': code, 'message': message}
+    if index is not None:
+        rows = np.sort(np.asarray(index, dtype=np.int64)) + HEADER_LINES + 1
+        issue['count'] = int(len(rows))
+        issue['rows'] = rows[:MAX_REPORTED_ROWS].tolist()
+    issue.update(details)
+    return issue
+
+
+def validate_match_data(df: pd.DataFrame) -> Dict[str, Any]:
+    """Check a tagging export with column operations and return a quality report.
+
+    Errors make the file unusable for analysis; warnings describe rows that
+    MatchDataProcessor would silently drop or interpret in a surprising way.
+    """
+    errors: List[Dict[str, Any]] = []
+    warnings: List[Dict[str, Any]] = []
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        errors.append(_issue('missing_columns', f"Missing required columns: {missing}", columns=missing))
+        return _report(df, errors, warnings, teams=[])
+
+    row = df['Row']
+    start = pd.to_numeric(df['Start time'], errors='coerce')
+    duration = pd.to_numeric(df['Duration'], errors='coerce')
+    player = df["PLAYER'S NAME"]
+    outcome = df['OUTCOME']
+
+    is_rally = row.eq('RALLY')
+    if not is_rally.any():
+        errors.append(_issue('no_rallies', "No RALLY rows found"))
+
+    bad_duration = is_rally & (duration.isna() | (duration < 0))
+    if bad_duration.any():
+        errors.append(_issue('invalid_duration', "RALLY duration is missing, negative or not a number",
+                             df.index[bad_duration]))
+
+    # Teams are the Row values that carry a WINNER/ERROR outcome
+    is_outcome_row = outcome.isin(OUTCOME_TYPES) & row.notna()
+    team_counts = row[is_outcome_row].value_counts()
+    teams = row[is_outcome_row].unique().tolist()
+    if len(teams) != 2:
+        errors.append(_issue(
+            'team_count',
+            f"Expected exactly 2 teams, found {len(teams)}: {teams}",
+            df.index[is_outcome_row & ~row.isin(team_counts.index[:2])] if len(teams) > 2 else None,
+            teams={team: int(count) for team, count in team_counts.items()},
+        ))
+
+    is_team_row = row.isin(teams)
+
+    # Rallies and outcomes cannot be placed without a time; other rows (notes,
+    # shots) without one only sort after the last rally, which is worth a
+    # warning. A time that is present but not a number breaks the analysis
+    # (and the sort) on any row.
+    missing_start = df['Start time'].isna()
+    bad_start = (start.isna() & ~missing_start) | (missing_start & (is_rally | is_team_row))
+    if bad_start.any():
+        errors.append(_issue('invalid_start_time',
+                             "Start time is not a number, or is missing on a RALLY or outcome row",
+                             df.index[bad_start]))
+    untimed = missing_start & ~is_rally & ~is_team_row
+    if untimed.any():
+        warnings.append(_issue('row_without_start_time',
+                               "Rows without a Start time are grouped with the last rally",
+                               df.index[untimed]))
+
+    bad_outcome = is_team_row & ~outcome.isin(OUTCOME_TYPES)
+    if bad_outcome.any():
+        errors.append(_issue('invalid_outcome', f"Team rows must have an OUTCOME of {OUTCOME_TYPES}",
+                             df.index[bad_outcome]))
+
+    # Reproduce the processor's grouping: rows sorted by start time (with the
+    # same sort as process_match_data) belong to the most recent RALLY row.
+    order = start.sort_values().index
+    rally_id = is_rally.loc[order].cumsum()
+
+    is_shot = ~is_rally & ~is_team_row
+    orphans = (rally_id == 0) & ~is_rally.loc[order]
+    if orphans.any():
+        warnings.append(_issue('rows_before_first_rally',
+                               "Rows before the first RALLY row are ignored",
+                               orphans.index[orphans]))
+
+    shot_without_player = is_shot.loc[order] & player.loc[order].isna() & (rally_id > 0)
+    if shot_without_player.any():
+        warnings.append(_issue('shot_without_player', "Shot rows without a PLAYER'S NAME are ignored",
+                               shot_without_player.index[shot_without_player]))
+
+    outcomes_per_rally = is_team_row.loc[order].groupby(rally_id).sum()
+    rally_rows = order[is_rally.loc[order].to_numpy()]
+    rally_outcomes = outcomes_per_rally.loc[rally_id.loc[rally_rows]].to_numpy()
+    no_outcome = rally_rows[rally_outcomes == 0]
+    if len(no_outcome):
+        warnings.append(_issue('rally_without_outcome',
+                               "Rallies without an outcome row are not scored", no_outcome))
+    several_outcomes = rally_rows[rally_outcomes > 1]
+    if len(several_outcomes):
+        warnings.append(_issue('rally_with_several_outcomes',
+                               "Rallies with more than one outcome row keep only the last", several_outcomes))
+
+    rally_start = start.loc[rally_rows]
+    rally_end = rally_start + duration.loc[rally_rows]
+    overlapping = rally_start.to_numpy()[1:] < rally_end.to_numpy()[:-1]
+    if overlapping.any():
+        warnings.append(_issue('overlapping_rallies',
+                               "RALLY starts before the previous rally has ended",
+                               rally_rows[1:][overlapping]))
+
+    # Players are only known to a team through team rows that name them
+    known_players = player[is_team_row].dropna().unique()
+    unknown = is_shot & player.notna() & ~player.isin(known_players)
+    if unknown.any():
+        names = sorted(player[unknown].unique().tolist())
+        warnings.append(_issue('unknown_players',
+                               "Players not linked to a team are left out of finishing statistics",
+                               df.index[unknown], players=names))
+
+    return _report(df, errors, warnings, teams=teams if len(teams) == 2 else [])
+
+
+def _report(df: pd.DataFrame, errors: List[Dict], warnings: List[Dict], teams: List[str]) -> Dict[str, Any]:
+    return {
+        'valid': not errors,
+        'rows': int(len(df)),
+        'teams': teams,
+        'errors': errors,
+        'warnings': warnings,
+    }
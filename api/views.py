@@ -1,116 +1,530 @@
 # api/views.py
-from rest_framework.views import APIView
-from rest_framework.response import Response
+from django.conf import settings
+from django.core.cache import caches
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
-from .utils import MatchDataProcessor
+from rest_framework.renderers import JSONRenderer
+from .comparison import DEFAULT_TOP_SEQUENCES, ComparisonError, compare_summaries, match_summary_id
+from .compression import ANALYSIS_SECTIONS, analysis_cache_key, cache_encoded, cached_encoded, encoded_response
+from .concurrency import AnalysisUnavailable, admission, run_in_executor
+from .export import (
+    DEFAULT_SET_SCORES, EXPORT_FORMATS, TABLE_COLUMNS, csv_chunk, csv_header, validate_matches, write_columnar,
+)
+from .memory import RequestMemoryLog, memory_stage, profiling, run_profiled
+from .models import MatchSummary
+from .utils import analyze_match_summarized, ingest_csv
+from .validation import MatchDataError
 import json
-from io import StringIO
+import os
+import tempfile
 import traceback
 import logging
-from rest_framework.parsers import MultiPartParser, FormParser
 
 logger = logging.getLogger(__name__)
 
-class UploadFileView(APIView):
-    parser_classes = (MultiPartParser, FormParser)
+# Per-process history of memory reports (ANALYSIS_MEMORY_PROFILING only)
+request_memory_log = RequestMemoryLog(settings.ANALYSIS_MEMORY_HISTORY)
 
-    def post(self, request):
+
+def json_response(data, status=status.HTTP_200_OK, headers=None) -> HttpResponse:
+    """Render `data` with DRF's JSON renderer (handles NumPy/pandas scalars)."""
+    response = HttpResponse(
+        JSONRenderer().render(data),
+        content_type='application/json',
+        status=status,
+    )
+    for header, value in (headers or {}).items():
+        response[header] = value
+    return response
+
+
+class AsyncAnalysisView(View):
+    """Base class for async endpoints that offload work to the analysis executor.
+
+    Requests are admitted only while the number of in-flight analyses is under
+    ANALYSIS_MAX_IN_FLIGHT and the body is under ANALYSIS_MAX_UPLOAD_BYTES, so
+    bursts are turned away quickly instead of queueing behind large matches.
+
+    Subclasses that set `memory_endpoint` are profiled when
+    ANALYSIS_MEMORY_PROFILING is on: stages in this process and on the
+    executor are recorded in `request_memory_log`.
+    """
+    memory_endpoint = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like DRF's APIView, these endpoints are not protected by CSRF
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method.lower() not in self.http_method_names or request.method == 'OPTIONS':
+            return await super().dispatch(request, *args, **kwargs)
+
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > settings.ANALYSIS_MAX_UPLOAD_BYTES:
+            logger.warning(f"Rejected request of {content_length} bytes (limit {settings.ANALYSIS_MAX_UPLOAD_BYTES})")
+            return self.reject(
+                f'Request too large: limit is {settings.ANALYSIS_MAX_UPLOAD_BYTES} bytes',
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        if not admission.try_acquire():
+            logger.warning(f"Rejected request: {admission.in_flight} analyses already in flight")
+            return self.reject(
+                'Server busy, please retry shortly',
+                status.HTTP_429_TOO_MANY_REQUESTS,
+            )
+
+        release = True
+        try:
+            profile_memory = settings.ANALYSIS_MEMORY_PROFILING and self.memory_endpoint is not None
+            self.worker_memory = None
+            with profiling(profile_memory, settings.ANALYSIS_MEMORY_TOP_SITES) as profile:
+                response = await super().dispatch(request, *args, **kwargs)
+            if profile is not None:
+                request_memory_log.record(self.memory_endpoint, profile.report(), self.worker_memory,
+                                          settings.ANALYSIS_MEMORY_BUDGET_MB)
+            if response.streaming:
+                # Streamed bodies still run analyses; the server closes the
+                # response once it has been sent or the client went away
+                response._resource_closers.append(admission.release)
+                release = False
+            return response
+        finally:
+            if release:
+                admission.release()
+
+    async def run_analysis(self, func, *args):
+        """Run `func(*args)` on the executor, keeping its memory report when profiling."""
+        if not settings.ANALYSIS_MEMORY_PROFILING or self.memory_endpoint is None:
+            return await run_in_executor(func, *args)
+        result, self.worker_memory = await run_in_executor(
+            run_profiled, func, args, True, settings.ANALYSIS_MEMORY_TOP_SITES,
+            # Process workers run one request at a time; threads share the counter
+            settings.ANALYSIS_EXECUTOR == 'process',
+        )
+        return result
+
+    def unavailable(self) -> HttpResponse:
+        logger.error("Analysis executor unavailable after a retry")
+        return self.reject('Analysis workers are restarting, please retry shortly',
+                           status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def reject(self, message: str, status_code: int) -> HttpResponse:
+        return json_response(
+            {'error': message},
+            status=status_code,
+            headers={'Retry-After': str(settings.ANALYSIS_RETRY_AFTER_SECONDS)},
+        )
+
+
+class UploadFileView(AsyncAnalysisView):
+    http_method_names = ['post', 'options']
+    memory_endpoint = 'upload'
+
+    async def post(self, request):
         try:
             logger.info("Starting file upload process")
-            
+
             if 'file' not in request.FILES:
-                return Response(
+                return json_response(
                     {'error': 'No file uploaded'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
             file = request.FILES['file']
             logger.info(f"Processing file: {file.name}")
+            # dispatch() only sees a Content-Length; chunked uploads are checked here
+            if file.size > settings.ANALYSIS_MAX_UPLOAD_BYTES:
+                logger.warning(f"Rejected upload of {file.size} bytes (limit {settings.ANALYSIS_MAX_UPLOAD_BYTES})")
+                return self.reject(
+                    f'File too large: limit is {settings.ANALYSIS_MAX_UPLOAD_BYTES} bytes',
+                    status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                )
 
             try:
-                content = file.read()
-                if isinstance(content, bytes):
-                    content = content.decode('utf-8')
-                
-                file_obj = StringIO(content)
-                processor = MatchDataProcessor(file_obj)
-                teams = processor._extract_teams()
-                
+                with memory_stage('decode'):
+                    content = file.read()
+                    if isinstance(content, bytes):
+                        content = content.decode('utf-8')
+
+                # Validate once at ingest so problems surface before any analysis
+                ingest = await self.run_analysis(ingest_csv, content)
+
                 # Return the data directly instead of using session
-                return Response({
-                    'teams': teams,
-                    'fileData': content,
-                    'message': 'File uploaded successfully'
-                })
-                
+                with memory_stage('render_response'):
+                    return json_response({
+                        'teams': ingest['teams'],
+                        'fileData': content,
+                        'qualityReport': ingest['qualityReport'],
+                        'message': 'File uploaded successfully'
+                    })
+
+            except AnalysisUnavailable:
+                return self.unavailable()
+            except MatchDataError as e:
+                logger.warning(f"Uploaded file failed validation: {str(e)}")
+                return json_response(
+                    {'error': f'Error processing file: {str(e)}', 'qualityReport': e.report},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             except Exception as e:
                 logger.error(f"Error processing file: {str(e)}")
                 logger.error(traceback.format_exc())
-                return Response(
+                return json_response(
                     {'error': f'Error processing file: {str(e)}'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-                
+
         except Exception as e:
             logger.error(f"Unexpected error in upload: {str(e)}")
             logger.error(traceback.format_exc())
-            return Response(
+            return json_response(
                 {'error': f'Server error: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class AnalyzeMatchView(APIView):
-    def post(self, request):
+class AnalyzeMatchView(AsyncAnalysisView):
+    http_method_names = ['post', 'options']
+    memory_endpoint = 'analyze'
+
+    async def post(self, request):
         try:
+            try:
+                with memory_stage('decode'):
+                    data = json.loads(request.body or b'{}')
+            except (ValueError, UnicodeDecodeError) as e:
+                return json_response(
+                    {'error': f'Invalid JSON body: {str(e)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
             # Debug logging
-            logger.debug(f"Received data: {request.data}")
-            
-            if 'set_scores' not in request.data:
-                return Response(
+            logger.debug(f"Received data keys: {list(data)}")
+
+            if 'set_scores' not in data:
+                return json_response(
                     {'error': 'No scores provided'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            if 'file_data' not in request.data:
-                return Response(
+
+            if 'file_data' not in data:
+                return json_response(
                     {'error': 'No file data provided'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
+
+            include = data.get('include', list(ANALYSIS_SECTIONS))
+            if not isinstance(include, list) or not set(include) <= set(ANALYSIS_SECTIONS):
+                return json_response(
+                    {'error': f'include must be a list drawn from {list(ANALYSIS_SECTIONS)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
             try:
-                # Convert file data to file-like object
-                file_data = request.data['file_data']
-                file = StringIO(file_data)
-                
+                file_data = data['file_data']
+
                 # Debug the scores format
-                scores = request.data['set_scores']
+                scores = data['set_scores']
                 logger.debug(f"Scores received: {scores}")
-                
-                # Create processor and process data
-                processor = MatchDataProcessor(file)
-                
-                # Debug the extracted teams
-                logger.debug(f"Extracted teams: {processor.teams}")
-                
-                # Process the match data
-                analysis_result = processor.process_match_data(scores)
-                
-                print("Debug - Analysis result:", analysis_result)
-                
-                return Response(analysis_result)
-                
+
+                # Identical requests are served from the stored, precompressed bytes
+                key = analysis_cache_key(file_data, scores, include)
+                match_id = match_summary_id(file_data, scores)
+                encoded = await cached_encoded(caches['analysis'], key, request)
+                if encoded is None:
+                    # Parse, process and compress the match off the event loop
+                    encoded, summary = await self.run_analysis(analyze_match_summarized, file_data, scores,
+                                                               include, settings.ANALYSIS_ENGINE,
+                                                               settings.MATCH_STORE_DIR,
+                                                               settings.MATCH_STORE_MAX_BYTES)
+                    # The summary is kept too, so a cache hit can still store it
+                    await caches['analysis'].aset(f'{key}:summary', summary)
+                    await cache_encoded(caches['analysis'], key, encoded)
+                    await self.save_summary(match_id, data.get('label', ''), summary)
+                else:
+                    logger.info(f"Serving cached analysis {key}")
+                    # e.g. the summary was deleted, or saving it failed the first time
+                    await self.restore_summary(key, match_id, data.get('label', ''))
+
+                return encoded_response(request, encoded, headers={
+                    'Content-Location': reverse('analysis_result', args=[key]),
+                    'X-Match-Id': match_id,
+                })
+
+            except AnalysisUnavailable:
+                return self.unavailable()
+            except MatchDataError as e:
+                logger.warning(f"Match data failed validation: {str(e)}")
+                return json_response(
+                    {'error': f'Error processing data: {str(e)}', 'qualityReport': e.report},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             except Exception as e:
                 logger.error(f"Error processing data: {str(e)}")
                 logger.error(traceback.format_exc())
-                return Response(
+                return json_response(
                     {'error': f'Error processing data: {str(e)}'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
+
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
             logger.error(traceback.format_exc())
-            return Response(
+            return json_response(
                 {'error': f'Unexpected error: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+    async def save_summary(self, match_id: str, label: str, summary: dict):
+        """Persist the comparison summary; a failure here must not fail the analysis."""
+        try:
+            await MatchSummary.objects.aupdate_or_create(
+                match_id=match_id,
+                defaults={'label': str(label)[:255], 'teams': summary['teams'], 'summary': summary},
+            )
+        except Exception as e:
+            logger.error(f"Error saving summary of match {match_id}: {str(e)}")
+
+    async def restore_summary(self, key: str, match_id: str, label: str):
+        """Save the cached summary of a cache hit if its row is missing; never fails the analysis."""
+        try:
+            if await MatchSummary.objects.filter(match_id=match_id).aexists():
+                return
+            summary = await caches['analysis'].aget(f'{key}:summary')
+            if summary is not None:
+                await MatchSummary.objects.aget_or_create(
+                    match_id=match_id,
+                    defaults={'label': str(label)[:255], 'teams': summary['teams'], 'summary': summary},
+                )
+        except Exception as e:
+            logger.error(f"Error restoring summary of match {match_id}: {str(e)}")
+
+
+class AnalysisResultView(View):
+    """Conditional GET of a previously computed analysis by its cache key."""
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request, key):
+        encoded = await cached_encoded(caches['analysis'], key, request)
+        if encoded is None:
+            return json_response(
+                {'error': 'Analysis not found or expired, please analyze the match again'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return encoded_response(request, encoded, conditional=True)
+
+
+class MatchSummaryListView(View):
+    """Most recently analyzed matches, optionally only those of a team or player."""
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request):
+        team = request.GET.get('team', '').lower()
+        player = request.GET.get('player', '').lower()
+        try:
+            limit = min(int(request.GET.get('limit', 10)), 100)
+        except ValueError:
+            return json_response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = []
+        async for match in MatchSummary.objects.values('match_id', 'label', 'teams', 'summary__players',
+                                                       'created_at'):
+            if team and team not in (name.lower() for name in match['teams']):
+                continue
+            players = [name.lower() for names in (match['summary__players'] or {}).values() for name in names]
+            if player and player not in players:
+                continue
+            matches.append({
+                'matchId': match['match_id'],
+                'label': match['label'],
+                'teams': match['teams'],
+                'createdAt': match['created_at'],
+            })
+            if len(matches) == limit:
+                break
+        return json_response({'matches': matches})
+
+
+class CompareMatchesView(View):
+    """Side-by-side metrics of one team or players across stored match summaries.
+
+    GET /api/compare/?match=<id>&match=<id>...[&team=<pair>][&player=<name>...]
+    [&top_sequences=<n>]; no CSV is parsed.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request):
+        match_ids = request.GET.getlist('match')
+        if not match_ids:
+            return json_response({'error': 'No match ids provided'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top_sequences = int(request.GET.get('top_sequences', DEFAULT_TOP_SEQUENCES))
+        except ValueError:
+            return json_response({'error': 'top_sequences must be an integer'},
+                                 status=status.HTTP_400_BAD_REQUEST)
+
+        stored = {
+            match.match_id: match
+            async for match in MatchSummary.objects.filter(match_id__in=match_ids)
+        }
+        missing = [match_id for match_id in match_ids if match_id not in stored]
+        if missing:
+            return json_response(
+                {'error': 'Unknown match ids, analyze these matches first', 'missing': missing},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            comparison = compare_summaries(
+                [{'matchId': match_id, 'label': stored[match_id].label, 'summary': stored[match_id].summary}
+                 for match_id in match_ids],
+                team=request.GET.get('team') or None,
+                players=request.GET.getlist('player') or None,
+                top_sequences=top_sequences,
+            )
+        except ComparisonError as e:
+            return json_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return json_response(comparison)
+
+
+class MemoryMetricsView(View):
+    """Recent per-request memory reports of this server process (staff only).
+
+    Only routed when ANALYSIS_MEMORY_PROFILING is on.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request):
+        user = await request.auser()
+        if not user.is_staff:
+            return json_response(
+                {'error': 'Memory metrics are only available to staff'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return json_response({
+            'enabled': settings.ANALYSIS_MEMORY_PROFILING,
+            'budgetMB': settings.ANALYSIS_MEMORY_BUDGET_MB,
+            'pid': os.getpid(),
+            **request_memory_log.summary(),
+        })
+
+
+class ExportView(AsyncAnalysisView):
+    """Bulk export of rally, shot or statistics tables for many matches.
+
+    Expects {"matches": [{"match_id", "file_data", "set_scores"?}, ...],
+    "table": "rallies" | "shots" | "statistics", "format": "parquet" | "arrow" | "csv"}.
+    """
+    http_method_names = ['post', 'options']
+
+    CONTENT_TYPES = {
+        'parquet': 'application/vnd.apache.parquet',
+        'arrow': 'application/vnd.apache.arrow.file',
+        'csv': 'text/csv',
+    }
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except (ValueError, UnicodeDecodeError) as e:
+            return json_response(
+                {'error': f'Invalid JSON body: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        table = data.get('table', 'rallies')
+        fmt = data.get('format', 'parquet')
+        if table not in TABLE_COLUMNS:
+            return json_response(
+                {'error': f'table must be one of {list(TABLE_COLUMNS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if fmt not in EXPORT_FORMATS:
+            return json_response(
+                {'error': f'format must be one of {list(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            matches = [
+                (str(match['match_id']), match['file_data'], match.get('set_scores', DEFAULT_SET_SCORES))
+                for match in data['matches']
+            ]
+        except (KeyError, TypeError):
+            return json_response(
+                {'error': 'matches must be a list of objects with match_id and file_data'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        filename = f'{table}.{fmt}'
+        if fmt == 'csv':
+            try:
+                # Bad data is reported here, before the 200 of the streamed body
+                await run_in_executor(validate_matches, matches)
+            except AnalysisUnavailable:
+                return self.unavailable()
+            except MatchDataError as e:
+                return json_response(
+                    {'error': f'Error processing data: {str(e)}', 'qualityReport': e.report},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            except Exception as e:
+                logger.error(f"Error validating matches for export: {str(e)}")
+                return json_response(
+                    {'error': f'Error exporting matches: {str(e)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return self.stream_csv(matches, table, filename)
+
+        fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+        os.close(fd)
+        try:
+            await run_in_executor(write_columnar, matches, {table: path}, fmt)
+            # The open handle keeps the data readable after the name is removed
+            response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename,
+                                    content_type=self.CONTENT_TYPES[fmt])
+        except AnalysisUnavailable:
+            return self.unavailable()
+        except MatchDataError as e:
+            return json_response(
+                {'error': f'Error processing data: {str(e)}', 'qualityReport': e.report},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            logger.error(f"Error exporting matches: {str(e)}")
+            logger.error(traceback.format_exc())
+            return json_response(
+                {'error': f'Error exporting matches: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        finally:
+            os.unlink(path)
+        return response
+
+    def stream_csv(self, matches, table: str, filename: str) -> StreamingHttpResponse:
+        """Stream CSV one match at a time from already validated matches.
+
+        An unexpected failure part-way is re-raised, so the server aborts the
+        response instead of ending it cleanly and the client sees a truncated
+        transfer rather than a short but complete-looking CSV.
+        """
+        async def rows():
+            yield csv_header(table)
+            for match in matches:
+                try:
+                    yield await run_in_executor(csv_chunk, match, table)
+                except Exception as e:
+                    logger.error(f"Error exporting match {match[0]}, aborting the CSV stream: {str(e)}")
+                    raise
+
+        response = StreamingHttpResponse(rows(), content_type=self.CONTENT_TYPES['csv'])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -0,0 +1,134 @@
+import numpy as np
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+# BWF rally-point scoring: a game is won at 21 with a 2-point lead,
+# otherwise the first side to 30 wins it (29-all decides on the next point).
+POINTS_TO_WIN = 21
+POINT_CAP = 30
+GAMES_TO_WIN = 2
+
+# Serving side in the tables
+TEAM1_SERVING = 0
+TEAM2_SERVING = 1
+
+# Point-win probabilities are rounded to this many decimals before the table
+# lookup so that every request for the same match hits the same cache entry.
+PROBABILITY_PRECISION = 3
+
+# Serve-win estimates are shrunk toward PRIOR_SERVE_WIN as if each side had
+# already served PRIOR_RALLIES rallies, so a handful of points cannot push the
+# curve to certainty.
+PRIOR_SERVE_WIN = 0.5
+PRIOR_RALLIES = 20
+
+
+def _game_over(team1_score: int, team2_score: int) -> Optional[bool]:
+    """Return True/False if team 1/team 2 has won the game, None if it is still live."""
+    if team1_score == POINT_CAP or (team1_score >= POINTS_TO_WIN and team1_score - team2_score >= 2):
+        return True
+    if team2_score == POINT_CAP or (team2_score >= POINTS_TO_WIN and team2_score - team1_score >= 2):
+        return False
+    return None
+
+
+class WinProbabilityTable:
+    """Match win probabilities for team 1 over every (sets, score, server) state."""
+
+    def __init__(self, team1_serve_win: float, team2_serve_win: float):
+        self.team1_serve_win = team1_serve_win
+        self.team2_serve_win = team2_serve_win
+
+        # Probability that team 1 wins the rally, indexed by server
+        rally_win = (team1_serve_win, 1.0 - team2_serve_win)
+
+        # game[a, b, s]: P(team 1 wins the game from a-b with server s)
+        size = POINT_CAP + 1
+        game = np.zeros((size, size, 2))
+        for a in range(POINT_CAP, -1, -1):
+            for b in range(POINT_CAP, -1, -1):
+                result = _game_over(a, b)
+                if result is not None:
+                    game[a, b, :] = 1.0 if result else 0.0
+                    continue
+                for server in (TEAM1_SERVING, TEAM2_SERVING):
+                    p = rally_win[server]
+                    game[a, b, server] = p * game[a + 1, b, TEAM1_SERVING] + \
+                        (1.0 - p) * game[a, b + 1, TEAM2_SERVING]
+        self.game = game
+
+        # match[x, y, s]: P(team 1 wins the match at the start of a game with
+        # sets won x-y and server s). The winner of a game serves first in the next.
+        match = np.zeros((GAMES_TO_WIN + 1, GAMES_TO_WIN + 1, 2))
+        match[GAMES_TO_WIN, :, :] = 1.0
+        match[:, GAMES_TO_WIN, :] = 0.0
+        for x in range(GAMES_TO_WIN - 1, -1, -1):
+            for y in range(GAMES_TO_WIN - 1, -1, -1):
+                for server in (TEAM1_SERVING, TEAM2_SERVING):
+                    g = game[0, 0, server]
+                    match[x, y, server] = g * match[x + 1, y, TEAM1_SERVING] + \
+                        (1.0 - g) * match[x, y + 1, TEAM2_SERVING]
+        self.match = match
+
+    def match_win(self, sets: Tuple[int, int], score: Tuple[int, int], server: Optional[int]) -> float:
+        """P(team 1 wins the match) from a pre-rally state. An unknown server averages both."""
+        if server is None:
+            return 0.5 * (self.match_win(sets, score, TEAM1_SERVING) +
+                          self.match_win(sets, score, TEAM2_SERVING))
+
+        sets1, sets2 = (min(s, GAMES_TO_WIN) for s in sets)
+        if sets1 == GAMES_TO_WIN:
+            return 1.0
+        if sets2 == GAMES_TO_WIN:
+            return 0.0
+
+        a, b = (min(s, POINT_CAP) for s in score)
+        g = self.game[a, b, server]
+        return float(g * self.match[sets1 + 1, sets2, TEAM1_SERVING] +
+                     (1.0 - g) * self.match[sets1, sets2 + 1, TEAM2_SERVING])
+
+    def point_importance(self, sets: Tuple[int, int], score: Tuple[int, int]) -> float:
+        """P(win match | win the rally) - P(win match | lose the rally) for team 1."""
+        a, b = score
+        return self.after_rally(sets, (a + 1, b), TEAM1_SERVING) - \
+            self.after_rally(sets, (a, b + 1), TEAM2_SERVING)
+
+    def after_rally(self, sets: Tuple[int, int], score: Tuple[int, int], rally_winner: int) -> float:
+        """Match win probability once a rally won by `rally_winner` has produced `score`."""
+        result = _game_over(*score)
+        if result is True:
+            return self.match_win((sets[0] + 1, sets[1]), (0, 0), TEAM1_SERVING)
+        if result is False:
+            return self.match_win((sets[0], sets[1] + 1), (0, 0), TEAM2_SERVING)
+        # In rally-point scoring the rally winner serves next
+        return self.match_win(sets, score, rally_winner)
+
+
+@lru_cache(maxsize=128)
+def get_win_probability_table(team1_serve_win: float, team2_serve_win: float) -> WinProbabilityTable:
+    """Build (once per parameter pair) the win-probability table."""
+    return WinProbabilityTable(team1_serve_win, team2_serve_win)
+
+
+def estimate_serve_win_probabilities(rallies: Iterable[Tuple[Optional[int], int]],
+                                     prior: float = PRIOR_SERVE_WIN,
+                                     prior_rallies: int = PRIOR_RALLIES) -> Tuple[float, float]:
+    """Estimate each team's probability of winning a rally on its own serve.
+
+    `rallies` yields (server, rally_winner) pairs; rallies with an unknown
+    server are ignored. The estimate is shrunk toward `prior` with the weight
+    of `prior_rallies` rallies, and is exactly `prior` with no rallies.
+    """
+    served = [0, 0]
+    won = [0, 0]
+    for server, winner in rallies:
+        if server is None:
+            continue
+        served[server] += 1
+        if winner == server:
+            won[server] += 1
+
+    return tuple(
+        round((won[side] + prior * prior_rallies) / (served[side] + prior_rallies), PROBABILITY_PRECISION)
+        for side in (TEAM1_SERVING, TEAM2_SERVING)
+    )
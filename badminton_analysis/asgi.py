@@ -3,6 +3,17 @@ ASGI config for badminton_analysis project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The API views are async and offload match processing to a bounded executor,
+so serve this module with an ASGI worker, e.g.:
+
+    WEB_CONCURRENCY=4 gunicorn badminton_analysis.asgi:application -k uvicorn.workers.UvicornWorker
+
+Each gunicorn worker runs its own executor of ANALYSIS_MAX_WORKERS processes,
+which defaults to the CPU count divided by WEB_CONCURRENCY. Set the worker
+count through WEB_CONCURRENCY (gunicorn's default for --workers) rather than
+-w, or set ANALYSIS_MAX_WORKERS to match, so the host does not run workers x
+CPUs analysis processes.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
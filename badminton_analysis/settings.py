@@ -35,6 +35,9 @@ ALLOWED_HOSTS = [
     'badminton-analysis-frontend.onrender.com',  # Your frontend domain
 ]
 
+# Extra hosts for local runs (e.g. the load-test harness), comma separated
+ALLOWED_HOSTS += [host for host in os.environ.get('DJANGO_EXTRA_ALLOWED_HOSTS', '').split(',') if host]
+
 
 # Application definition
 
@@ -123,6 +126,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'if-none-match',
 ]
 
 WSGI_APPLICATION = 'badminton_analysis.wsgi.application'
@@ -227,6 +231,73 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler'
 }
 
+# Analysis concurrency and admission control
+# CPU-heavy match processing runs on a bounded executor ('process' or 'thread');
+# requests beyond ANALYSIS_MAX_IN_FLIGHT get a 429 and bodies larger than
+# ANALYSIS_MAX_UPLOAD_BYTES a 413, both with a Retry-After header.
+# Every gunicorn worker starts its own executor, so by default the CPUs are
+# split between the WEB_CONCURRENCY workers (gunicorn's default --workers).
+ANALYSIS_EXECUTOR = os.environ.get('ANALYSIS_EXECUTOR', 'process')
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+ANALYSIS_MAX_WORKERS = int(os.environ.get('ANALYSIS_MAX_WORKERS', max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+ANALYSIS_MAX_IN_FLIGHT = int(os.environ.get('ANALYSIS_MAX_IN_FLIGHT', ANALYSIS_MAX_WORKERS * 2))
+ANALYSIS_MAX_UPLOAD_BYTES = int(os.environ.get('ANALYSIS_MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+ANALYSIS_RETRY_AFTER_SECONDS = int(os.environ.get('ANALYSIS_RETRY_AFTER_SECONDS', 5))
+
+# Rally-building engine for MatchDataProcessor ('iterrows' or 'columnar'); every
+# engine is checked against api/reference.py by the differential tests
+ANALYSIS_ENGINE = os.environ.get('ANALYSIS_ENGINE', 'iterrows')
+
+# The analyze endpoint receives the CSV inside its JSON body
+DATA_UPLOAD_MAX_MEMORY_SIZE = ANALYSIS_MAX_UPLOAD_BYTES
+
+# Rendered and precompressed /api/analyze/ results, keyed by a digest of the
+# CSV, set scores and included sections, with each content coding stored
+# under its own key. They live on disk so every gunicorn worker on the host
+# serves the Content-Location GET of any other worker's analysis; point
+# ANALYSIS_CACHE_DIR at shared storage (or swap the backend for Redis) when
+# running several hosts. The backend unpickles what it reads, so the
+# directory must only be writable by the app (hence not under /tmp).
+ANALYSIS_CACHE_TIMEOUT = int(os.environ.get('ANALYSIS_CACHE_TIMEOUT', 60 * 60))
+ANALYSIS_CACHE_DIR = os.environ.get('ANALYSIS_CACHE_DIR', str(BASE_DIR / 'analysis-cache'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analysis': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': ANALYSIS_CACHE_DIR,
+        'TIMEOUT': ANALYSIS_CACHE_TIMEOUT,
+        'OPTIONS': {
+            # About 256 analyses: an entry, up to three bodies and a summary each
+            'MAX_ENTRIES': 256 * 5,
+        },
+    },
+}
+
+# Let the frontend read the validators of cached analysis results
+CORS_EXPOSE_HEADERS = [
+    'content-location',
+    'etag',
+    'x-match-id',
+]
+
+# Parsed matches (rally and shot columns) shared read-only by every worker on
+# the host through memory-mapped Arrow files; empty disables the store
+MATCH_STORE_DIR = os.environ.get('MATCH_STORE_DIR', str(BASE_DIR / 'match-store'))
+# Once its data files would outgrow this, the store starts over with empty files
+MATCH_STORE_MAX_BYTES = int(os.environ.get('MATCH_STORE_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Opt-in memory instrumentation for the upload and analyze endpoints: per-stage
+# tracemalloc peaks and top allocation sites plus per-request peak RSS, served
+# to staff at /api/metrics/memory/ (routed only while profiling is on);
+# requests above the budget are logged as warnings
+ANALYSIS_MEMORY_PROFILING = os.environ.get('ANALYSIS_MEMORY_PROFILING', '').lower() in ('1', 'true', 'yes')
+ANALYSIS_MEMORY_BUDGET_MB = float(os.environ.get('ANALYSIS_MEMORY_BUDGET_MB', 256))
+ANALYSIS_MEMORY_TOP_SITES = int(os.environ.get('ANALYSIS_MEMORY_TOP_SITES', 5))
+ANALYSIS_MEMORY_HISTORY = int(os.environ.get('ANALYSIS_MEMORY_HISTORY', 200))
+
 # Session settings
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 SESSION_COOKIE_SECURE = True
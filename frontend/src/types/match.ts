@@ -55,6 +55,15 @@ export interface Shot {
     [key: string]: number | string;
   }
   
+  export interface WinProbabilityData {
+    rally: number;
+    number: number;
+    score: string;
+    importance: number;
+    pointWinner: string;
+    [key: string]: number | string;
+  }
+  
   export interface MatchData {
     teams: string[];
     players: {
@@ -84,6 +93,12 @@ export interface Shot {
         set2: MomentumData[];
         set3?: MomentumData[];
       };
+      winProbability: {
+        serveWinProbability: { [set: string]: { [team: string]: number } };
+        set1: WinProbabilityData[];
+        set2: WinProbabilityData[];
+        set3?: WinProbabilityData[];
+      };
     };
     pointsTimeline: {
       [team: string]: Array<{ time: number }>;
@@ -0,0 +1,48 @@
+"""
+Check every MatchDataProcessor engine against the frozen reference on random
+tagging exports, then report each engine's speedup over the reference.
+
+Examples:
+    python scripts/compare_engines.py
+    python scripts/compare_engines.py --cases 500 --seed 42 --repeat 5
+"""
+import argparse
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from api.differential import REFERENCE, benchmark, compare_engines, generate_case  # noqa: E402
+from api.utils import ENGINES  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', type=int, default=100, help="Random exports to check")
+    parser.add_argument('--seed', type=int, default=0, help="First seed; case i uses seed + i")
+    parser.add_argument('--repeat', type=int, default=3, help="Timing repetitions (best is kept)")
+    parser.add_argument('--valid-only', action='store_true', help="Skip edge-case mutations")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    args = parser.parse_args()
+
+    cases = [generate_case(args.seed + i, edge_cases=not args.valid_only) for i in range(args.cases)]
+
+    failures = 0
+    for i, (name, content, set_scores) in enumerate(cases):
+        for engine, difference in compare_engines(content, set_scores, args.engines).items():
+            failures += 1
+            print(f"MISMATCH seed={args.seed + i} case={name} engine={engine}: {difference}")
+    print(f"{len(cases)} cases, {failures} mismatches")
+
+    results = benchmark(cases, args.engines, args.repeat)
+    print(f"\n{'engine':<12}{'total s':>10}{'per case ms':>14}{'speedup':>10}")
+    for engine in (REFERENCE, *args.engines):
+        result = results[engine]
+        print(f"{engine:<12}{result['seconds']:>10.3f}{result['per_case_ms']:>14.2f}{result['speedup']:>9.2f}x")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+"""
+End-to-end load test for the upload -> analyze flow.
+
+Starts the app under gunicorn (sync/gthread workers via wsgi.py, or uvicorn
+workers via asgi.py), drives concurrent /api/upload/ + /api/analyze/ flows with
+synthetic tagging exports of several sizes, and reports throughput, latency
+percentiles, error rates and peak RSS per worker. Results are written as JSON
+so runs can be compared.
+
+Examples:
+    python scripts/load_test.py --servers sync:4 gthread:4 uvicorn:4 --concurrency 50
+    python scripts/load_test.py --servers uvicorn:2 --compare loadtest-results/<previous>.json
+    python scripts/load_test.py --url http://127.0.0.1:8000  # an already running server
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from api.synthetic import generate_match_csv  # noqa: E402
+
+# worker kind -> (gunicorn worker class, application module, extra gunicorn args)
+WORKER_KINDS = {
+    'sync': ('sync', 'badminton_analysis.wsgi:application', []),
+    'gthread': ('gthread', 'badminton_analysis.wsgi:application', ['--threads', '4']),
+    'uvicorn': ('uvicorn.workers.UvicornWorker', 'badminton_analysis.asgi:application', []),
+}
+
+SET_SCORES = {'set1': {}, 'set2': {}, 'set3': {}}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        'count': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        **{f'p{p}_ms': round(percentile(latencies, p) * 1000, 2) if latencies else None for p in (50, 95, 99)},
+        'max_ms': round(max(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def read_rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def parent_pids() -> Dict[int, int]:
+    """Parent of every running process, read from /proc."""
+    parents = {}
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces; fields after the closing paren are fixed
+        fields = stat.rsplit(')', 1)[1].split()
+        parents[int(entry.name)] = int(fields[1])
+    return parents
+
+
+def worker_trees(master: int) -> Dict[int, List[int]]:
+    """Each gunicorn worker with all of its descendants (e.g. analysis executor processes)."""
+    children: Dict[int, List[int]] = {}
+    for pid, parent in parent_pids().items():
+        children.setdefault(parent, []).append(pid)
+    trees = {}
+    for worker in children.get(master, []):
+        tree, pending = [], [worker]
+        while pending:
+            pid = pending.pop()
+            tree.append(pid)
+            pending.extend(children.get(pid, []))
+        trees[worker] = tree
+    return trees
+
+
+class RSSSampler(threading.Thread):
+    """Periodically records the peak RSS of the gunicorn master's workers.
+
+    A worker's RSS includes its descendants, since the process executor does
+    the pandas work in grandchildren of the master. Pages shared after fork
+    are counted once per process, so the figures are upper bounds.
+    """
+
+    def __init__(self, master_pid: int, interval: float = 0.25):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak_kb: Dict[int, int] = {}
+        self.processes_seen = set()
+        self._done = threading.Event()
+
+    def run(self):
+        if not Path('/proc').exists():
+            return
+        while not self._done.is_set():
+            for worker, tree in worker_trees(self.master_pid).items():
+                sizes = [rss for rss in map(read_rss_kb, tree) if rss is not None]
+                if sizes:
+                    self.peak_kb[worker] = max(sum(sizes), self.peak_kb.get(worker, 0))
+                self.processes_seen.update(tree)
+            self._done.wait(self.interval)
+
+    def stop(self) -> Dict[str, Any]:
+        self._done.set()
+        self.join()
+        peaks = sorted(self.peak_kb.values())
+        return {
+            'workers_seen': len(peaks),
+            'processes_seen': len(self.processes_seen),
+            'peak_rss_mb_per_worker': [round(kb / 1024, 1) for kb in peaks],
+            'peak_rss_mb_total': round(sum(peaks) / 1024, 1),
+        }
+
+
+def start_server(kind: str, workers: int, port: int, env_overrides: Dict[str, str]) -> subprocess.Popen:
+    worker_class, app, extra = WORKER_KINDS[kind]
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SECRET_KEY', 'load-test-secret-key')
+    env['DJANGO_EXTRA_ALLOWED_HOSTS'] = '127.0.0.1,localhost'
+    env.update(env_overrides)
+    command = [
+        sys.executable, '-m', 'gunicorn', app,
+        '--workers', str(workers),
+        '--worker-class', worker_class,
+        '--bind', f'127.0.0.1:{port}',
+        '--timeout', '300',
+        '--log-level', 'warning',
+        *extra,
+    ]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'{base_url}/api/upload/', timeout=2)
+            return
+        except urllib.error.HTTPError:
+            return  # Any HTTP answer (405 for GET) means the workers are up
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s")
+
+
+def multipart_body(field: str, filename: str, content: bytes):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        'Content-Type: text/csv\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def request(url: str, body: bytes, content_type: str, accept_encoding: Optional[str] = None):
+    headers = {'Content-Type': content_type}
+    if accept_encoding:
+        headers['Accept-Encoding'] = accept_encoding
+    req = urllib.request.Request(url, data=body, headers=headers, method='POST')
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=300) as response:
+            payload = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        payload = e.read()
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        payload, status = b'', 'connection-error'
+    return status, payload, time.perf_counter() - start
+
+
+def run_flow(base_url: str, csv_content: str) -> Dict[str, Any]:
+    """One coach opening a dashboard: upload the CSV, then analyze it."""
+    result = {'upload_status': None, 'analyze_status': None}
+    body, content_type = multipart_body('file', 'match.csv', csv_content.encode())
+    status, payload, upload_latency = request(f'{base_url}/api/upload/', body, content_type)
+    result.update(upload_status=status, upload_latency=upload_latency)
+    if status != 200:
+        return result
+
+    file_data = json.loads(payload)['fileData']
+    body = json.dumps({'set_scores': SET_SCORES, 'file_data': file_data}).encode()
+    status, _, analyze_latency = request(f'{base_url}/api/analyze/', body, 'application/json',
+                                         accept_encoding='gzip')
+    result.update(analyze_status=status, analyze_latency=analyze_latency,
+                  flow_latency=upload_latency + analyze_latency)
+    return result
+
+
+def drive(base_url: str, payloads: List[str], flows: int, concurrency: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: run_flow(base_url, payloads[i % len(payloads)]), range(flows)))
+    elapsed = time.perf_counter() - started
+
+    statuses: Dict[str, int] = {}
+    for result in results:
+        for step in ('upload', 'analyze'):
+            status = result[f'{step}_status']
+            if status is not None:
+                key = f'{step}:{status}'
+                statuses[key] = statuses.get(key, 0) + 1
+
+    completed = [r for r in results if r['analyze_status'] == 200]
+    # 429/413 answers are admission control working, not failures, so errors
+    # are counted only among the flows the server accepted
+    rejected = [r for r in results if 429 in (r['upload_status'], r['analyze_status'])
+                or 413 in (r['upload_status'], r['analyze_status'])]
+    accepted = flows - len(rejected)
+    return {
+        'flows': flows,
+        'completed_flows': len(completed),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_flows_per_s': round(len(completed) / elapsed, 3) if elapsed else None,
+        'error_rate': round(1 - len(completed) / accepted, 4) if accepted else 0.0,
+        'rejected_rate': round(len(rejected) / flows, 4) if flows else 0.0,
+        'status_counts': statuses,
+        'upload_latency': summarize([r['upload_latency'] for r in results if r['upload_status'] == 200]),
+        'analyze_latency': summarize([r['analyze_latency'] for r in completed]),
+        'flow_latency': summarize([r['flow_latency'] for r in completed]),
+    }
+
+
+def build_payloads(sizes: List[int], pool: int, max_shots: int) -> Dict[int, List[str]]:
+    """Distinct synthetic exports per size, so repeated flows within a run do not hit the cache.
+
+    The exports are the same for every server configuration; each server gets
+    its own empty analysis cache and match store (see main) so they all do the
+    same work.
+    """
+    return {
+        size: [generate_match_csv(rallies=size, max_shots=max_shots, seed=seed) for seed in range(pool)]
+        for size in sizes
+    }
+
+
+def print_summary(runs: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None):
+    previous = {(r['server'], r['rallies']): r for r in (baseline or {}).get('runs', [])}
+    header = f"{'server':<14}{'rallies':>8}{'flows/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}{'429/413':>9}{'RSS MB':>9}"
+    print(header)
+    print('-' * len(header))
+    for run in runs:
+        flow = run['flow_latency']
+        line = (f"{run['server']:<14}{run['rallies']:>8}{run['throughput_flows_per_s'] or 0:>10.2f}"
+                f"{flow['p50_ms'] or 0:>10.1f}{flow['p95_ms'] or 0:>10.1f}{flow['p99_ms'] or 0:>10.1f}"
+                f"{run['error_rate']:>9.1%}{run['rejected_rate']:>9.1%}{run.get('memory', {}).get('peak_rss_mb_total', 0):>9.1f}")
+        print(line)
+        old = previous.get((run['server'], run['rallies']))
+        if old and old['flow_latency']['p95_ms'] and flow['p95_ms']:
+            print(f"{'':<14}{'vs prev':>8}"
+                  f"{(run['throughput_flows_per_s'] or 0) - (old['throughput_flows_per_s'] or 0):>+10.2f}"
+                  f"{flow['p50_ms'] - old['flow_latency']['p50_ms']:>+10.1f}"
+                  f"{flow['p95_ms'] - old['flow_latency']['p95_ms']:>+10.1f}"
+                  f"{flow['p99_ms'] - old['flow_latency']['p99_ms']:>+10.1f}")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', nargs='+', default=['sync:2', 'uvicorn:2'],
+                        help="Worker configurations as kind:count, kind in " + ', '.join(WORKER_KINDS))
+    parser.add_argument('--url', help="Drive an already running server instead of starting gunicorn "
+                                        "(its analysis cache and match store are used as they are)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[60, 180],
+                        help="Rallies per synthetic match")
+    parser.add_argument('--max-shots', type=int, default=8, help="Maximum shots per synthetic rally")
+    parser.add_argument('--flows', type=int, default=200, help="upload -> analyze flows per size")
+    parser.add_argument('--concurrency', type=int, default=50, help="Concurrent simulated clients")
+    parser.add_argument('--payload-pool', type=int, default=None,
+                        help="Distinct CSVs per size (default: one per flow)")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE',
+                        help="Extra environment for the server, e.g. ANALYSIS_EXECUTOR=thread")
+    parser.add_argument('--output-dir', default=str(REPO_ROOT / 'loadtest-results'))
+    parser.add_argument('--compare', help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    env_overrides = dict(item.split('=', 1) for item in args.env)
+    payloads = build_payloads(args.sizes, args.payload_pool or args.flows, args.max_shots)
+    servers = [('external', 0)] if args.url else [
+        (kind, int(count)) for kind, count in (spec.split(':') for spec in args.servers)
+    ]
+
+    runs = []
+    for kind, workers in servers:
+        process = None
+        state = None
+        base_url = args.url.rstrip('/') if args.url else f'http://127.0.0.1:{args.port}'
+        if not args.url:
+            if kind not in WORKER_KINDS:
+                parser.error(f"Unknown worker kind {kind!r}")
+            # The analysis cache and match store live on disk and outlive the
+            # server; fresh ones keep earlier configurations and runs from
+            # answering this one's requests
+            state = tempfile.TemporaryDirectory(prefix='loadtest-')
+            env = {
+                'ANALYSIS_CACHE_DIR': os.path.join(state.name, 'analysis-cache'),
+                'MATCH_STORE_DIR': os.path.join(state.name, 'match-store'),
+                **env_overrides,
+            }
+            process = start_server(kind, workers, args.port, env)
+        try:
+            wait_until_ready(base_url)
+            for size in args.sizes:
+                sampler = RSSSampler(process.pid) if process else None
+                if sampler:
+                    sampler.start()
+                print(f"Running {args.flows} flows of {size} rallies against {kind}:{workers} "
+                      f"with {args.concurrency} clients", file=sys.stderr)
+                run = drive(base_url, payloads[size], args.flows, args.concurrency)
+                run.update(server=f'{kind}:{workers}', worker_class=kind, workers=workers, rallies=size,
+                           csv_bytes=len(payloads[size][0]))
+                if sampler:
+                    run['memory'] = sampler.stop()
+                runs.append(run)
+        finally:
+            if process:
+                process.terminate()
+                process.wait(timeout=30)
+            if state:
+                state.cleanup()
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_revision': git_revision(),
+        'host': {'cpus': os.cpu_count(), 'python': platform.python_version(), 'platform': platform.platform()},
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output_dir', 'compare')},
+        'runs': runs,
+    }
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = output_dir / f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.write_text(json.dumps(report, indent=2))
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_summary(runs, baseline)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == '__main__':
+    main()